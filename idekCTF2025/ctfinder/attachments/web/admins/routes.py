@@ -1,6 +1,20 @@
 from flask import Blueprint, request, jsonify, session as flask_session, g, render_template, Response, current_app, redirect, url_for
 from redis_config import get_redis
-from database import get_db
+from database import get_db, get_pool_stats
+from sessions.workers import get_stream_executor
+from sessions.publisher import get_publisher_stats
+from sessions.multiplexer import get_multiplexer
+from sessions.sanitizer import get_sanitizer_cache_stats
+from tokens.utils import get_token_cache_stats
+from sessions.versions import get_render_cache_stats
+from sessions.history import get_history_stats, get_budget_stats
+from sessions.completions import get_completion_cache_stats
+from sessions.hedging import get_hedge_stats
+from sessions.jobs import get_queue_stats
+from auth.hashing import get_password_hasher
+from sessions.reports import get_report_stats
+from admins.utils import list_report_logs, report_content_hash, InvalidReportQuery, REPORT_FILTERS, REPORT_PAGE_SIZE, REPORT_PAGE_MAX
+from ratelimit import get_rate_limit_stats, get_limits, set_limits, CONFIG_FIELDS
 from decorators import login_required, token_required
 import hashlib
 import uuid
@@ -14,22 +28,25 @@ def get_report_log(session_id):
     is_admin = flask_session['is_admin']
 
     db = get_db()
-    report_logs = db.execute('SELECT * FROM report_logs WHERE session_id = ?', (session_id,)).fetchall()
+    if is_admin:
+        report_logs = db.execute('SELECT * FROM report_logs WHERE session_id = ?', (session_id,)).fetchall()
+    else:
+        report_logs = db.execute('SELECT * FROM report_logs WHERE session_id = ? AND user_id = ?', (session_id, user_id)).fetchall()
 
-    if not report_logs:
+    # an empty list still means the session has reports, just none of yours
+    if not report_logs and not db.execute('SELECT 1 FROM report_logs WHERE session_id = ? LIMIT 1', (session_id,)).fetchone():
         return jsonify({'error': 'No report logs found'}), 404
 
     report_logs_json = []
 
     for report_log in report_logs:
-        if report_log['user_id'] == user_id or is_admin:
-            report_logs_json.append({
-                'id': report_log['id'],
-                'user_id': report_log['user_id'],
-                'session_id': report_log['session_id'],
-                'message_id': report_log['message_id'],
-                'report_message': report_log['report_message'] if is_admin else "Cannot view report message"
-            })
+        report_logs_json.append({
+            'id': report_log['id'],
+            'user_id': report_log['user_id'],
+            'session_id': report_log['session_id'],
+            'message_id': report_log['message_id'],
+            'report_message': report_log['report_message'] if is_admin else "Cannot view report message"
+        })
 
     return jsonify({'report_logs': report_logs_json}), 200
 
@@ -53,14 +70,114 @@ def save_report_log(session_id):
     report_message = report_message.replace('\n', '').replace('\r', '').replace('\t', '').replace('<', '&lt;').replace('>', '&gt;')
     message_id = hashlib.sha256(report_message.encode()).hexdigest()
 
+    content_hash = report_content_hash(reporter_id, report_message)
+
+    # the unique index on content_hash does the duplicate check
     db = get_db()
-    existing_report = db.execute('SELECT id FROM report_logs WHERE report_message = ? AND user_id = ?', (message_id, reporter_id)).fetchone()
+    cursor = db.execute(
+        'INSERT OR IGNORE INTO report_logs (id, user_id, admin_id, session_id, message_id, report_message, content_hash) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (str(uuid.uuid4()), reporter_id, user_id, session_id, message_id, report_message, content_hash)
+    )
+    db.commit()
 
-    if existing_report:
+    if cursor.rowcount == 0:
         return jsonify({'error': 'Report already exists'}), 400
-    
-    db.execute('INSERT INTO report_logs (id, user_id, admin_id, session_id, message_id, report_message) VALUES (?, ?, ?, ?, ?, ?)', (str(uuid.uuid4()), reporter_id, user_id, session_id, message_id, report_message))
-    db.commit()
 
     return jsonify({'message': 'Report saved'}), 200
-    
\ No newline at end of file
+
+@admin_bp.route('/reports', methods=['GET'])
+@login_required
+def list_reports():
+    is_admin = flask_session['is_admin']
+
+    if not is_admin:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    try:
+        limit = int(request.args.get('limit', REPORT_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+
+    if not 1 <= limit <= REPORT_PAGE_MAX:
+        return jsonify({'error': f'limit must be between 1 and {REPORT_PAGE_MAX}'}), 400
+
+    filters = {name: request.args.get(name) for name in (*REPORT_FILTERS, 'since', 'until')}
+
+    try:
+        report_logs, next_cursor = list_report_logs(get_db(), filters, limit, request.args.get('cursor'))
+    except InvalidReportQuery as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify({
+        'report_logs': [dict(report_log) for report_log in report_logs],
+        'next_cursor': next_cursor
+    }), 200
+
+@admin_bp.route('/metrics', methods=['GET'])
+@login_required
+def get_metrics():
+    is_admin = flask_session['is_admin']
+
+    if not is_admin:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    return jsonify({
+        'db_pool': get_pool_stats(),
+        'stream_workers': get_stream_executor().get_stats(),
+        'stream_publisher': get_publisher_stats(),
+        'stream_subscribers': get_multiplexer().get_stats(),
+        'sanitizer_cache': get_sanitizer_cache_stats(),
+        'token_cache': get_token_cache_stats(),
+        'render_cache': get_render_cache_stats(),
+        'history_cache': get_history_stats(),
+        'history_budget': get_budget_stats(),
+        'completion_cache': get_completion_cache_stats(),
+        'upstream_hedging': get_hedge_stats(),
+        'rate_limit': get_rate_limit_stats(),
+        'stream_queue': get_queue_stats(),
+        'password_hashing': get_password_hasher().get_stats(),
+        'report_dispatch': get_report_stats()
+    }), 200
+
+@admin_bp.route('/ratelimit', methods=['GET'])
+@login_required
+def get_rate_limits():
+    is_admin = flask_session['is_admin']
+
+    if not is_admin:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    return jsonify({'limits': get_limits()}), 200
+
+@admin_bp.route('/ratelimit', methods=['PUT'])
+@login_required
+def update_rate_limits():
+    is_admin = flask_session['is_admin']
+
+    if not is_admin:
+        return jsonify({'error': 'Unauthorized'}), 401
+
+    data = request.get_json()
+
+    if not data:
+        return jsonify({'error': f"one of {', '.join(CONFIG_FIELDS)} is required"}), 400
+
+    limits = {}
+    for field in CONFIG_FIELDS:
+        if field not in data:
+            continue
+
+        try:
+            limits[field] = float(data[field])
+        except (TypeError, ValueError):
+            return jsonify({'error': f'{field} must be a number'}), 400
+
+        if limits[field] < 0:
+            return jsonify({'error': f'{field} must not be negative'}), 400
+
+    if not limits:
+        return jsonify({'error': f"one of {', '.join(CONFIG_FIELDS)} is required"}), 400
+
+    set_limits(limits)
+
+    return jsonify({'limits': get_limits()}), 200
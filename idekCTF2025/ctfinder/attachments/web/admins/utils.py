@@ -0,0 +1,95 @@
+import base64
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+REPORT_PAGE_SIZE = int(os.getenv('REPORT_PAGE_SIZE', 50))
+REPORT_PAGE_MAX = int(os.getenv('REPORT_PAGE_MAX', 200))
+
+REPORT_FILTERS = ('user_id', 'admin_id', 'session_id')
+
+
+class InvalidReportQuery(Exception):
+    pass
+
+
+def report_content_hash(user_id, report_message):
+    """Dedupe key of a report: one row per reporter and message text"""
+    return hashlib.sha256(f'{user_id}\0{report_message}'.encode()).hexdigest()
+
+def encode_cursor(created_at, report_id):
+    return base64.urlsafe_b64encode(json.dumps([created_at, report_id]).encode()).decode()
+
+def decode_cursor(cursor):
+    """(created_at, id) of the last row of the previous page. Both go into
+    the keyset comparison as they are, so anything but two strings in the
+    shape encode_cursor writes is rejected."""
+    try:
+        decoded = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        raise InvalidReportQuery('invalid cursor')
+
+    if not isinstance(decoded, list) or len(decoded) != 2 or not all(isinstance(part, str) for part in decoded):
+        raise InvalidReportQuery('invalid cursor')
+
+    created_at, report_id = decoded
+    try:
+        return parse_timestamp(created_at, 'cursor'), report_id
+    except InvalidReportQuery:
+        raise InvalidReportQuery('invalid cursor')
+
+def parse_timestamp(value, name):
+    """Normalise a date or datetime to created_at's 'YYYY-MM-DD HH:MM:SS'
+    text form, so it compares correctly against the column. created_at is
+    SQLite's CURRENT_TIMESTAMP, i.e. UTC; a value with an offset is converted
+    to UTC first and one without is taken as UTC."""
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        raise InvalidReportQuery(f'{name} must be an ISO date or datetime')
+
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc)
+    return parsed.strftime('%Y-%m-%d %H:%M:%S')
+
+def list_report_logs(db, filters, limit=REPORT_PAGE_SIZE, cursor=None):
+    """One page of report logs, newest first.
+
+    Filters go into the WHERE clause and the page continues from the
+    (created_at, id) of the cursor, so every page is a range scan over
+    idx_report_logs_created or idx_report_logs_user_created no matter how
+    deep it is. Returns (rows, next_cursor); next_cursor is None on the
+    last page.
+    """
+    clauses = []
+    params = []
+
+    for column in REPORT_FILTERS:
+        if filters.get(column):
+            clauses.append(f'{column} = ?')
+            params.append(filters[column])
+
+    if filters.get('since'):
+        clauses.append('created_at >= ?')
+        params.append(parse_timestamp(filters['since'], 'since'))
+    if filters.get('until'):
+        clauses.append('created_at < ?')
+        params.append(parse_timestamp(filters['until'], 'until'))
+
+    if cursor:
+        clauses.append('(created_at, id) < (?, ?)')
+        params.extend(decode_cursor(cursor))
+
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    rows = db.execute(
+        'SELECT id, user_id, admin_id, session_id, message_id, report_message, created_at '
+        f'FROM report_logs {where} ORDER BY created_at DESC, id DESC LIMIT ?',
+        (*params, limit + 1)
+    ).fetchall()
+
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
@@ -5,22 +5,12 @@ import secrets
 from auth.routes import auth_bp
 from sessions.routes import session_bp
 from tokens.routes import token_bp
-from database import get_db, init_db
+from database import get_db, init_db, close_db
 from admins.routes import admin_bp
 
-app = Flask(__name__)
-
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'TBD')
-app.config['SESSION_COOKIE_HTTPONLY'] = True
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-
-DATABASE = '/app/data/ctfinder.db'
-
-@app.before_request
 def generate_nonce():
     g.csp_nonce = secrets.token_urlsafe(16)
 
-@app.after_request
 def add_security_headers(response):
     nonce = getattr(g, 'csp_nonce', '')
     csp_policy = (
@@ -40,7 +30,10 @@ def add_security_headers(response):
         "frame-ancestors 'none'; "
     )
 
-    response.headers['Content-Security-Policy'] = csp_policy
+    # a 304 keeps the cached page, whose scripts carry the nonce it was
+    # rendered with; a new policy here would block them
+    if response.status_code != 304:
+        response.headers['Content-Security-Policy'] = csp_policy.strip()
     response.headers['X-Content-Type-Options'] = 'nosniff'
     response.headers['X-Frame-Options'] = 'DENY'
     response.headers['X-XSS-Protection'] = '1; mode=block'
@@ -48,24 +41,40 @@ def add_security_headers(response):
     
     return response
 
-@app.teardown_appcontext
 def close_connection(exception):
-    db = getattr(g, '_database', None)
-    if db is not None:
-        db.close()
+    close_db(exception)
 
-app.register_blueprint(auth_bp)
-app.register_blueprint(session_bp)
-app.register_blueprint(token_bp)
-app.register_blueprint(admin_bp)
-
-@app.route('/', methods=['GET', 'POST'])
 def index():
     if request.method == 'GET':
         return render_template('index.html')
     elif request.method == 'POST':
         return jsonify({'message': 'POST method not allowed'}), 405
 
+def create_app():
+    """Build the Flask app. Serving entry points (serve.py, asgi.py) take
+    care of init_db; this only wires config, hooks and blueprints."""
+    app = Flask(__name__)
+
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'TBD')
+    app.config['SESSION_COOKIE_HTTPONLY'] = True
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+
+    app.before_request(generate_nonce)
+    app.after_request(add_security_headers)
+    app.teardown_appcontext(close_connection)
+
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(session_bp)
+    app.register_blueprint(token_bp)
+    app.register_blueprint(admin_bp)
+
+    app.add_url_rule('/', view_func=index, methods=['GET', 'POST'])
+
+    return app
+
+app = create_app()
+
 if __name__ == '__main__':
+    # development server; production runs `python serve.py`
     init_db(app)
-    app.run(host='0.0.0.0', port=1337, debug=False) 
\ No newline at end of file
+    app.run(host='0.0.0.0', port=int(os.getenv('SERVER_PORT', 1337)), debug=False) 
\ No newline at end of file
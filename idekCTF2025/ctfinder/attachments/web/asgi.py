@@ -0,0 +1,326 @@
+"""Async serving mode for the SSE endpoint.
+
+/sessions/<id>/stream is served here on a single event loop with an asyncio
+Redis client, so an idle stream costs a coroutine and a queue instead of a
+WSGI worker thread. Every other path is handed to the unchanged Flask app
+through a2wsgi when it is installed; otherwise route only the stream path to
+this process from the reverse proxy.
+
+    uvicorn asgi:application --host 0.0.0.0 --port 1337
+"""
+import asyncio
+import json
+import os
+import re
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from app import app as flask_app
+from database import init_db_locked
+from redis_config import get_async_pubsub_redis
+from tokens.utils import get_token_by_user_id
+from sessions.multiplexer import STREAM_HEARTBEAT_INTERVAL, STREAM_SUBSCRIBER_QUEUE_SIZE
+from sessions.transport import is_resumable, STREAM_IDLE_TIMEOUT
+from sessions.workers import get_stream_executor
+from auth.hashing import get_password_hasher
+from sessions.reports import get_report_executor
+
+try:
+    from a2wsgi import WSGIMiddleware
+    wsgi_fallback = WSGIMiddleware(flask_app, workers=int(os.getenv('ASGI_WSGI_THREADS', 16)))
+except ImportError:
+    wsgi_fallback = None
+
+STREAM_PATH = re.compile(r'^/sessions/([^/]+)/stream/?$')
+STREAM_ENTRY_ID = re.compile(r'^\d+(-\d+)?$')
+
+SSE_HEADERS = [
+    (b'content-type', b'text/event-stream; charset=utf-8'),
+    (b'cache-control', b'no-cache'),
+    (b'x-accel-buffering', b'no'),
+    (b'x-content-type-options', b'nosniff'),
+    (b'access-control-allow-origin', b'*'),
+    (b'access-control-allow-headers', b'Cache-Control'),
+]
+
+
+class AsyncPubSubMultiplexer:
+    """asyncio twin of sessions.multiplexer: one pub/sub connection for the
+    whole process, one reader task, one asyncio.Queue per subscriber."""
+
+    def __init__(self):
+        self._pubsub = None
+        self._subscribers = {}
+        self._task = None
+        self.stats = {'dispatched': 0, 'dropped': 0, 'subscribed_total': 0}
+
+    async def subscribe(self, channel):
+        subscriber = asyncio.Queue(maxsize=STREAM_SUBSCRIBER_QUEUE_SIZE)
+        subscribers = self._subscribers.setdefault(channel, set())
+        subscribers.add(subscriber)
+        self.stats['subscribed_total'] += 1
+
+        if self._pubsub is None:
+            self._pubsub = get_async_pubsub_redis().pubsub(ignore_subscribe_messages=True)
+        if len(subscribers) == 1:
+            await self._pubsub.subscribe(channel)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+        return subscriber
+
+    async def unsubscribe(self, channel, subscriber):
+        subscribers = self._subscribers.get(channel)
+        if not subscribers:
+            return
+
+        subscribers.discard(subscriber)
+        if not subscribers:
+            del self._subscribers[channel]
+            try:
+                await self._pubsub.unsubscribe(channel)
+            except Exception:
+                pass
+
+    async def _run(self):
+        # with nothing subscribed the pubsub has no connection to read from
+        # and get_message only raises; subscribe() starts a new reader
+        while self._subscribers:
+            try:
+                message = await self._pubsub.get_message(timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                await asyncio.sleep(1.0)
+                await self._reconnect()
+                continue
+
+            if message is None or message['type'] != 'message':
+                continue
+
+            for subscriber in list(self._subscribers.get(message['channel'], ())):
+                try:
+                    subscriber.put_nowait(message['data'])
+                    self.stats['dispatched'] += 1
+                except asyncio.QueueFull:
+                    self.stats['dropped'] += 1
+
+    async def _reconnect(self):
+        try:
+            await self._pubsub.close()
+        except Exception:
+            pass
+
+        self._pubsub = get_async_pubsub_redis().pubsub(ignore_subscribe_messages=True)
+        if self._subscribers:
+            try:
+                await self._pubsub.subscribe(*self._subscribers)
+            except Exception:
+                pass
+
+    def get_stats(self):
+        return dict(
+            self.stats,
+            channels=len(self._subscribers),
+            subscribers=sum(len(subscribers) for subscribers in self._subscribers.values())
+        )
+
+
+multiplexer = AsyncPubSubMultiplexer()
+
+def load_session(headers):
+    cookie = SimpleCookie(headers.get('cookie', ''))
+    morsel = cookie.get(flask_app.config.get('SESSION_COOKIE_NAME', 'session'))
+    if morsel is None:
+        return {}
+
+    serializer = flask_app.session_interface.get_signing_serializer(flask_app)
+    try:
+        return serializer.loads(morsel.value, max_age=int(flask_app.permanent_session_lifetime.total_seconds()))
+    except Exception:
+        return {}
+
+def has_token(user_id):
+    with flask_app.app_context():
+        return get_token_by_user_id(user_id) is not None
+
+async def send_json(send, status, body, extra_headers=()):
+    payload = json.dumps(body).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(payload)).encode()), *extra_headers]
+    })
+    await send({'type': 'http.response.body', 'body': payload})
+
+def format_event(data, event_id=None):
+    """SSE frame for one published payload and whether it ends the stream"""
+    try:
+        json_data = json.loads(data)
+    except json.JSONDecodeError:
+        return None, False
+
+    id_line = f"id: {event_id}\n" if event_id else ""
+
+    if json_data.get('event') == 'error':
+        return f"event: error\n{id_line}data: {data}\n\n", True
+
+    return f"{id_line}data: {data}\n\n", json_data.get('event') == 'complete'
+
+async def pubsub_events(channel):
+    subscriber = await multiplexer.subscribe(channel)
+    try:
+        while True:
+            try:
+                data = await asyncio.wait_for(subscriber.get(), timeout=STREAM_HEARTBEAT_INTERVAL)
+            except asyncio.TimeoutError:
+                yield f"data: {json.dumps({'event': 'heartbeat'})}\n\n", False
+                continue
+
+            frame, finished = format_event(data)
+            if frame:
+                yield frame, finished
+    finally:
+        await multiplexer.unsubscribe(channel, subscriber)
+
+async def replay_events(channel, last_event_id):
+    redis_client = get_async_pubsub_redis()
+    # Disconnects are noticed through receive(), so each XREAD can block for
+    # a whole heartbeat interval
+    block_ms = int(STREAM_HEARTBEAT_INTERVAL * 1000)
+
+    seen = False
+    idle_since = time.monotonic()
+
+    while True:
+        response = await redis_client.xread({channel: last_event_id}, block=block_ms, count=100)
+
+        if not response:
+            # same end conditions as sessions.transport.read_events
+            exists = await redis_client.exists(channel)
+            seen = seen or bool(exists)
+
+            if (seen and not exists) or time.monotonic() - idle_since >= STREAM_IDLE_TIMEOUT:
+                error_data = json.dumps({'event': 'error', 'message': 'Stream ended without a reply'})
+                yield f"event: error\ndata: {error_data}\n\n", True
+                return
+
+            yield f"data: {json.dumps({'event': 'heartbeat'})}\n\n", False
+            continue
+
+        seen = True
+        idle_since = time.monotonic()
+
+        for _, entries in response:
+            for entry_id, fields in entries:
+                last_event_id = entry_id
+                frame, finished = format_event(fields.get('data', ''), entry_id)
+                if frame:
+                    yield frame, finished
+
+async def stream_endpoint(scope, receive, send, session_id):
+    headers = {key.decode('latin-1'): value.decode('latin-1') for key, value in scope['headers']}
+    query = parse_qs(scope.get('query_string', b'').decode())
+    flask_session = load_session(headers)
+    user_id = flask_session.get('user_id')
+
+    if not user_id:
+        if 'application/json' in headers.get('accept', ''):
+            return await send_json(send, 401, {'error': 'login required'})
+        await send({'type': 'http.response.start', 'status': 302, 'headers': [(b'location', b'/auth/login')]})
+        return await send({'type': 'http.response.body', 'body': b''})
+
+    if not await asyncio.to_thread(has_token, user_id):
+        return await send_json(send, 401, {'error': 'token required'})
+
+    channel = query.get('channel', [None])[0]
+    if not channel or not channel.startswith("session:"):
+        return await send_json(send, 400, {'error': 'Invalid stream channel'})
+
+    channel_parts = channel.split(':')
+    if len(channel_parts) < 5 or channel_parts[1] != session_id or channel_parts[2] != user_id:
+        return await send_json(send, 403, {'error': 'Unauthorized'})
+
+    last_event_id = headers.get('last-event-id') or query.get('last_event_id', [None])[0]
+    if not last_event_id or not STREAM_ENTRY_ID.match(last_event_id):
+        last_event_id = '0'
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': SSE_HEADERS})
+
+    async def pump():
+        connected = {'event': 'connected', 'resumable': True} if is_resumable() else {'event': 'connected'}
+        await send({'type': 'http.response.body', 'body': f"data: {json.dumps(connected)}\n\n".encode(), 'more_body': True})
+
+        events = replay_events(channel, last_event_id) if is_resumable() else pubsub_events(channel)
+        try:
+            async for frame, finished in events:
+                await send({'type': 'http.response.body', 'body': frame.encode(), 'more_body': True})
+                if finished:
+                    break
+        except Exception as e:
+            error_data = json.dumps({'event': 'error', 'message': f'Stream connection error: {str(e)}'})
+            await send({'type': 'http.response.body', 'body': f"data: {error_data}\n\n".encode(), 'more_body': True})
+        finally:
+            await events.aclose()
+
+    async def wait_disconnect():
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+
+    pump_task = asyncio.create_task(pump())
+    disconnect_task = asyncio.create_task(wait_disconnect())
+    done, pending = await asyncio.wait({pump_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+
+    if pump_task in done:
+        await send({'type': 'http.response.body', 'body': b''})
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await asyncio.to_thread(init_db_locked, flask_app)
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # uvicorn only gets here once open connections have finished or
+            # its graceful timeout ran out; turns whose client went away may
+            # still be running and should get to save their reply
+            # close both before waiting on either: the report executor would
+            # otherwise keep taking new visits while the stream jobs drain
+            get_stream_executor().close()
+            get_report_executor().close()
+            stream_unfinished, report_unfinished = await asyncio.gather(
+                asyncio.to_thread(get_stream_executor().drain),
+                asyncio.to_thread(get_report_executor().drain)
+            )
+            if stream_unfinished:
+                print(f'shutdown: {stream_unfinished} stream jobs still running')
+            if report_unfinished:
+                print(f'shutdown: {report_unfinished} report visits still running')
+            get_password_hasher().shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        match = STREAM_PATH.match(scope['path'])
+        if match:
+            return await stream_endpoint(scope, receive, send, match.group(1))
+
+    if wsgi_fallback is not None:
+        return await wsgi_fallback(scope, receive, send)
+
+    await send_json(send, 404, {'error': 'Not found'})
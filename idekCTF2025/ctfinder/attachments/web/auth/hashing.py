@@ -0,0 +1,175 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import threading
+import time
+
+from werkzeug.security import generate_password_hash, check_password_hash, DEFAULT_PBKDF2_ITERATIONS
+
+# Any method werkzeug's generate_password_hash accepts, e.g.
+# 'pbkdf2:sha256:600000'. Stored hashes carry their own method, so changing
+# this only affects new hashes; logins rehash passwords stored with another.
+PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256')
+PASSWORD_SALT_LENGTH = int(os.getenv('PASSWORD_SALT_LENGTH', 16))
+# 0 hashes on the request thread, as before
+HASH_WORKERS = int(os.getenv('HASH_WORKERS', 2))
+HASH_QUEUE_SIZE = int(os.getenv('HASH_QUEUE_SIZE', 32))
+HASH_TIMEOUT = float(os.getenv('HASH_TIMEOUT', 10))
+HASH_RETRY_AFTER = int(os.getenv('HASH_RETRY_AFTER', 2))
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+# werkzeug's defaults for the parameters a method may leave out; stored
+# hashes always spell them out, e.g. 'pbkdf2:sha256' is stored as
+# 'pbkdf2:sha256:<iterations>'
+METHOD_DEFAULTS = {
+    'pbkdf2': ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)],
+}
+
+def normalize_method(method):
+    name, *params = method.split(':')
+    params += METHOD_DEFAULTS.get(name, [])[len(params):]
+    return ':'.join([name, *params])
+
+def check_method(method=PASSWORD_HASH_METHOD):
+    """Hash once with the configured method, so a method the installed
+    werkzeug cannot produce stops the process at startup instead of failing
+    every registration and login later."""
+    try:
+        generate_password_hash('x', method, PASSWORD_SALT_LENGTH)
+    except (ValueError, TypeError) as e:
+        raise ValueError(f'PASSWORD_HASH_METHOD {method!r} is not supported: {e}') from None
+
+check_method()
+
+def configured_method():
+    return normalize_method(PASSWORD_HASH_METHOD)
+
+def needs_rehash(pwhash):
+    return normalize_method(pwhash.split('$', 1)[0]) != configured_method()
+
+
+class PasswordHasher:
+    """Runs password hashing on a small process pool.
+
+    pbkdf2 keeps a core busy for a hundred milliseconds or more per login, so
+    it runs next to the request threads instead of on them. At most
+    max_workers hashes run at once and at most max_queue wait; past that
+    callers get HashPoolBusy and the route answers 503.
+    """
+
+    def __init__(self, max_workers=HASH_WORKERS, max_queue=HASH_QUEUE_SIZE, timeout=HASH_TIMEOUT):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._executor = None
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue) if max_workers else None
+        self.stats = {
+            'hashed': 0,
+            'verified': 0,
+            'rejected_busy': 0,
+            'timeouts': 0,
+            'pool_restarts': 0,
+            'time_total': 0.0,
+            'time_max': 0.0,
+        }
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # forkserver: the request process has threads, which fork
+                # would copy into the workers mid-flight
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context('forkserver')
+                )
+            return self._executor
+
+    def _restart(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+                self.stats['pool_restarts'] += 1
+        executor.shutdown(wait=False)
+
+    def _run(self, fn, *args):
+        started = time.monotonic()
+
+        if not self.max_workers:
+            result = fn(*args)
+        else:
+            if not self._slots.acquire(blocking=False):
+                with self._lock:
+                    self.stats['rejected_busy'] += 1
+                raise HashPoolBusy()
+
+            try:
+                executor = self._get_executor()
+                future = executor.submit(fn, *args)
+            except BaseException:
+                self._slots.release()
+                raise
+
+            # a caller that times out leaves its hash running in the pool;
+            # the slot stays taken until the hash is actually done
+            future.add_done_callback(lambda f: self._slots.release())
+
+            try:
+                result = future.result(timeout=self.timeout)
+            except BrokenProcessPool:
+                self._restart(executor)
+                raise
+            except FutureTimeout:
+                # still queued behind other hashes: drop it, which also
+                # frees the slot
+                future.cancel()
+                with self._lock:
+                    self.stats['timeouts'] += 1
+                raise HashPoolBusy()
+
+        elapsed = time.monotonic() - started
+        with self._lock:
+            self.stats['time_total'] += elapsed
+            self.stats['time_max'] = max(self.stats['time_max'], elapsed)
+
+        return result
+
+    def hash(self, password):
+        result = self._run(generate_password_hash, password, PASSWORD_HASH_METHOD, PASSWORD_SALT_LENGTH)
+        with self._lock:
+            self.stats['hashed'] += 1
+        return result
+
+    def verify(self, pwhash, password):
+        result = self._run(check_password_hash, pwhash, password)
+        with self._lock:
+            self.stats['verified'] += 1
+        return result
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+
+        done = stats['hashed'] + stats['verified']
+        stats['time_avg'] = stats['time_total'] / done if done else 0.0
+        stats['max_workers'] = self.max_workers
+        stats['max_queue'] = self.max_queue
+        stats['method'] = configured_method()
+        return stats
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+password_hasher = PasswordHasher()
+
+def get_password_hasher():
+    return password_hasher
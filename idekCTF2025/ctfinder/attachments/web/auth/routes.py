@@ -1,10 +1,11 @@
 from flask import Blueprint, request, jsonify, session, g, render_template
-from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 import uuid
 import os
+import traceback
 from decorators import login_required
 from database import get_db
+from auth.hashing import get_password_hasher, needs_rehash, HashPoolBusy, HASH_RETRY_AFTER
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/auth')
 
@@ -35,7 +36,7 @@ def register():
         if existing_user:
             return jsonify({'error': 'username already exists'}), 409
         
-        password_hash = generate_password_hash(password)
+        password_hash = get_password_hasher().hash(password)
         user_id = str(uuid.uuid4())
         
         db.execute(
@@ -49,6 +50,8 @@ def register():
             'user_id': user_id
         }), 201
         
+    except HashPoolBusy:
+        return jsonify({'error': 'server busy, try again later'}), 503, {'Retry-After': str(HASH_RETRY_AFTER)}
     except Exception as e:
         return jsonify({'error': f'registration failed'}), 500
 
@@ -69,8 +72,25 @@ def login():
             (username,)
         ).fetchone()
         
-        if not user or not check_password_hash(user['password'], password):
+        hasher = get_password_hasher()
+        if not user or not hasher.verify(user['password'], password):
             return jsonify({'error': 'invalid username or password'}), 401
+
+        if needs_rehash(user['password']):
+            # stored with an older PASSWORD_HASH_METHOD; the password is
+            # already verified, so upgrading is best effort and can wait for
+            # another login if the pool is busy or anything else goes wrong
+            try:
+                db.execute('UPDATE users SET password = ? WHERE id = ?', (hasher.hash(password), user['id']))
+                db.commit()
+            except HashPoolBusy:
+                pass
+            except Exception:
+                traceback.print_exc()
+                try:
+                    db.rollback()
+                except sqlite3.Error:
+                    pass
         
         session['user_id'] = user['id']
         session['username'] = user['username']
@@ -86,6 +106,8 @@ def login():
             }
         }), 200
         
+    except HashPoolBusy:
+        return jsonify({'error': 'server busy, try again later'}), 503, {'Retry-After': str(HASH_RETRY_AFTER)}
     except Exception as e:
         return jsonify({'error': f'login failed'}), 500
 
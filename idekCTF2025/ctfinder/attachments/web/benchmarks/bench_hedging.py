@@ -0,0 +1,71 @@
+"""Time to first token with and without request hedging, against the stub
+upstream in benchmarks/stub_upstream.py started in-process.
+
+    python benchmarks/bench_hedging.py --requests 100 --slow-rate 0.1 \\
+        --slow-delay 3 --hedge-after-ms 300
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from stub_upstream import add_arguments, make_server, stats as stub_stats
+
+def run(label, open_reply, requests):
+    ttft = []
+    started_all = time.perf_counter()
+
+    for _ in range(requests):
+        started = time.perf_counter()
+        response, reply = open_reply()
+        assert response.ok
+
+        first = None
+        text = []
+        for kind, value in reply:
+            if kind == 'delta':
+                if first is None:
+                    first = time.perf_counter() - started
+                text.append(value)
+
+        ttft.append(first)
+
+    elapsed = time.perf_counter() - started_all
+    ttft.sort()
+    print(f'{label:10} p50 {statistics.median(ttft) * 1000:8.1f} ms  '
+          f'p95 {ttft[int(len(ttft) * 0.95) - 1] * 1000:8.1f} ms  '
+          f'max {ttft[-1] * 1000:8.1f} ms  total {elapsed:6.1f} s')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--hedge-after-ms', type=float, default=300)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(args)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['ANTHROPIC_API_URL'] = f'http://127.0.0.1:{server.server_address[1]}/v1/messages'
+
+    from sessions.hedging import hedged_reply, get_hedge_stats
+    from sessions.stream import start_upstream_reply
+
+    headers = {'x-api-key': 'stub', 'anthropic-version': '2023-06-01', 'content-type': 'application/json'}
+    body = {'model': 'stub', 'max_tokens': 100, 'messages': [{'role': 'user', 'content': 'hi'}], 'stream': True}
+
+    run('single', lambda: start_upstream_reply(headers, body), args.requests)
+    run('hedged', lambda: hedged_reply(lambda: start_upstream_reply(headers, body), args.hedge_after_ms), args.requests)
+
+    stats = get_hedge_stats()
+    print(f"hedge rate {stats['hedge_rate']:.2%}  hedge wins {stats['hedge_wins']}  "
+          f"stub requests {stub_stats['requests']} slow {stub_stats['slow']} cancelled {stub_stats['cancelled']}")
+
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
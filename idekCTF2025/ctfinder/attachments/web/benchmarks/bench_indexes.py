@@ -0,0 +1,109 @@
+"""Query plans and latencies for the hot-path queries before and after the
+schema migrations.
+
+    python benchmarks/bench_indexes.py --users 2000 --messages 500000
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import create_tables
+from migrations import run_migrations
+
+QUERIES = [
+    ('session messages', 'SELECT id, role, content, token_count, parent_id, sequence_id FROM messages WHERE session_id = ? ORDER BY sequence_id DESC LIMIT 10', 'session'),
+    ('conversation history', 'SELECT * FROM messages WHERE session_id = ? AND user_id = ? ORDER BY sequence_id DESC LIMIT 10', 'session_user'),
+    ('last sequence id', 'SELECT sequence_id FROM messages WHERE session_id = ? ORDER BY sequence_id DESC LIMIT 1', 'session'),
+    ('user sessions', 'SELECT id, title FROM sessions WHERE user_id = ?', 'user'),
+    ('user token', 'SELECT token FROM tokens WHERE user_id = ?', 'user'),
+    ('report logs', 'SELECT * FROM report_logs WHERE session_id = ?', 'session'),
+    ('reporter page', 'SELECT * FROM report_logs WHERE user_id = ? ORDER BY created_at DESC, id DESC LIMIT 50', 'user'),
+]
+
+def populate(db, users, sessions_per_user, messages):
+    user_ids = [str(uuid.uuid4()) for _ in range(users)]
+    sessions = []
+
+    db.executemany('INSERT INTO users (id, username, password) VALUES (?, ?, ?)',
+                   ((user_id, user_id, 'x') for user_id in user_ids))
+    db.executemany('INSERT INTO tokens (id, token, user_id) VALUES (?, ?, ?)',
+                   ((str(uuid.uuid4()), str(uuid.uuid4()), user_id) for user_id in user_ids))
+
+    for user_id in user_ids:
+        for _ in range(sessions_per_user):
+            sessions.append((str(uuid.uuid4()), user_id))
+    db.executemany('INSERT INTO sessions (id, user_id) VALUES (?, ?)', sessions)
+
+    sequences = {}
+    rows = []
+    for _ in range(messages):
+        session_id, user_id = random.choice(sessions)
+        sequences[session_id] = sequences.get(session_id, 0) + 1
+        rows.append((str(uuid.uuid4()), session_id, user_id, random.choice(['user', 'assistant']),
+                     'x' * 200, 10, None, sequences[session_id]))
+    db.executemany('INSERT INTO messages (id, session_id, user_id, role, content, token_count, parent_id, sequence_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)', rows)
+
+    db.executemany('INSERT INTO report_logs (id, user_id, admin_id, session_id, message_id, report_message) VALUES (?, ?, ?, ?, ?, ?)',
+                   ((str(uuid.uuid4()), user_id, user_id, session_id, str(uuid.uuid4()), 'x') for session_id, user_id in random.sample(sessions, min(len(sessions), 5000))))
+    db.commit()
+
+    return sessions
+
+def measure(db, sessions, iterations):
+    results = {}
+
+    for name, sql, kind in QUERIES:
+        session_id, user_id = sessions[0]
+        params = {'session': (session_id,), 'session_user': (session_id, user_id), 'user': (user_id,)}[kind]
+        plan = ' / '.join(row[3] for row in db.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall())
+
+        samples = random.choices(sessions, k=iterations)
+        start = time.perf_counter()
+        for session_id, user_id in samples:
+            params = {'session': (session_id,), 'session_user': (session_id, user_id), 'user': (user_id,)}[kind]
+            db.execute(sql, params).fetchall()
+        elapsed = time.perf_counter() - start
+
+        results[name] = (plan, elapsed / iterations * 1e6)
+
+    return results
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--sessions-per-user', type=int, default=5)
+    parser.add_argument('--messages', type=int, default=200000)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    path = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    db = sqlite3.connect(path)
+    create_tables(db)
+
+    print(f'populating {args.messages} messages across {args.users * args.sessions_per_user} sessions...')
+    sessions = populate(db, args.users, args.sessions_per_user, args.messages)
+
+    before = measure(db, sessions, args.iterations)
+
+    start = time.perf_counter()
+    applied = run_migrations(db)
+    print(f'applied {[version for version, _ in applied]} in {time.perf_counter() - start:.2f}s\n')
+
+    after = measure(db, sessions, args.iterations)
+
+    for name in before:
+        print(name)
+        print(f'  before {before[name][1]:10.1f} us  {before[name][0]}')
+        print(f'  after  {after[name][1]:10.1f} us  {after[name][0]}')
+
+    db.close()
+
+if __name__ == '__main__':
+    main()
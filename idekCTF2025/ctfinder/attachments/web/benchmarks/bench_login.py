@@ -0,0 +1,113 @@
+"""Login throughput, and how much a login storm slows everything else on
+the same server process, with hashing inline (HASH_WORKERS=0) and on the
+process pool.
+
+Starts `python serve.py` with one worker per run on a scratch database,
+registers a user, then has --clients threads log in for --duration seconds
+while one probe thread keeps requesting /.
+
+    python benchmarks/bench_login.py --clients 16 --duration 10 --hash-workers 2
+"""
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_serving import WEB_DIR, free_port, wait_ready
+
+def post_json(conn, path, body):
+    conn.request('POST', path, body=json.dumps(body), headers={'Content-Type': 'application/json'})
+    response = conn.getresponse()
+    response.read()
+    return response.status
+
+def login_client(port, credentials, stop, latencies, statuses):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            status = post_json(conn, '/auth/login', credentials)
+        except (OSError, http.client.HTTPException):
+            status = 'connection'
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        statuses[status] = statuses.get(status, 0) + 1
+        if status == 200:
+            latencies.append(time.perf_counter() - started)
+    conn.close()
+
+def probe(port, stop, latencies):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    while not stop.is_set():
+        started = time.perf_counter()
+        conn.request('GET', '/')
+        conn.getresponse().read()
+        latencies.append(time.perf_counter() - started)
+        time.sleep(0.01)
+    conn.close()
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[max(0, int(len(values) * fraction) - 1)] * 1000
+
+def run(label, hash_workers, args, env):
+    port = free_port()
+    env = dict(env, SERVER_PORT=str(port), HASH_WORKERS=str(hash_workers))
+    server = subprocess.Popen([sys.executable, 'serve.py'], cwd=WEB_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        wait_ready(port)
+        credentials = {'username': f'bench-{port}', 'password': 'correct horse battery staple'}
+        post_json(http.client.HTTPConnection('127.0.0.1', port, timeout=30), '/auth/register', credentials)
+
+        stop = threading.Event()
+        logins, probes, statuses = [], [], {}
+        threads = [
+            threading.Thread(target=login_client, args=(port, credentials, stop, logins, statuses))
+            for _ in range(args.clients)
+        ]
+        threads.append(threading.Thread(target=probe, args=(port, stop, probes)))
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+    print(f'{label:8} logins {len(logins) / args.duration:6.1f}/s  '
+          f'p50 {statistics.median(logins) * 1000:7.0f} ms  p99 {percentile(logins, 0.99):7.0f} ms  |  '
+          f'probe p50 {statistics.median(probes) * 1000:6.1f} ms  p99 {percentile(probes, 0.99):7.1f} ms  '
+          f'statuses {statuses}')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--hash-workers', type=int, default=2)
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DATABASE_PATH=os.path.join(scratch, 'ctfinder.db'),
+        ADMIN_USERNAME=os.getenv('ADMIN_USERNAME', 'admin'),
+        ADMIN_PASSWORD=os.getenv('ADMIN_PASSWORD', 'bench'),
+        SERVER_WORKERS='1',
+    )
+
+    run('inline', 0, args, env)
+    run('pool', args.hash_workers, args, env)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""Request throughput of the development server against serve.py.
+
+Starts `python app.py` and `python serve.py` in turn on a scratch database,
+then has --clients threads issue keep-alive GETs for --duration seconds
+against each. Redis is not needed for the pages requested.
+
+    python benchmarks/bench_serving.py --clients 32 --duration 10 --workers 4
+"""
+import argparse
+import http.client
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+WEB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def wait_ready(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            conn.request('GET', '/')
+            conn.getresponse().read()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'server on port {port} did not come up')
+
+def client(port, paths, stop, latencies, errors):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+    i = 0
+    while not stop.is_set():
+        path = paths[i % len(paths)]
+        i += 1
+        started = time.perf_counter()
+        try:
+            conn.request('GET', path)
+            response = conn.getresponse()
+            response.read()
+            if response.status != 200:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException):
+            errors.append('connection')
+            conn.close()
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=10)
+            continue
+        latencies.append(time.perf_counter() - started)
+    conn.close()
+
+def run(label, command, args, env):
+    port = free_port()
+    env = dict(env, SERVER_PORT=str(port))
+    server = subprocess.Popen(command, cwd=WEB_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    try:
+        wait_ready(port)
+
+        stop = threading.Event()
+        latencies, errors = [], []
+        threads = [
+            threading.Thread(target=client, args=(port, args.paths, stop, latencies, errors))
+            for _ in range(args.clients)
+        ]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+    latencies.sort()
+    print(f'{label:8} {len(latencies) / args.duration:8.0f} req/s  '
+          f'p50 {statistics.median(latencies) * 1000:7.1f} ms  '
+          f'p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:7.1f} ms  '
+          f'errors {len(errors)}')
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--paths', nargs='+', default=['/', '/auth/login'])
+    args = parser.parse_args()
+
+    scratch = tempfile.mkdtemp()
+    env = dict(
+        os.environ,
+        DATABASE_PATH=os.path.join(scratch, 'ctfinder.db'),
+        ADMIN_USERNAME=os.getenv('ADMIN_USERNAME', 'admin'),
+        ADMIN_PASSWORD=os.getenv('ADMIN_PASSWORD', 'bench'),
+        SERVER_WORKERS=str(args.workers),
+    )
+
+    run('dev', [sys.executable, 'app.py'], args, env)
+    run('serve', [sys.executable, 'serve.py'], args, env)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+"""How many concurrent idle /stream connections a server holds open.
+
+Log in as a user with a token and a session, then point this at each serving
+mode with that session cookie:
+
+    python app.py                                    # threaded WSGI
+    uvicorn asgi:application --port 1337             # async SSE mode
+
+    python benchmarks/bench_sse_capacity.py --base http://127.0.0.1:1337 \\
+        --session-id <id> --user-id <id> --cookie 'session=...' --connections 2000
+
+A connection counts as held once it has received the 'connected' event and
+is still open after --hold seconds.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+from urllib.parse import quote, urlsplit
+
+async def open_stream(host, port, path, cookie, hold, results):
+    started = time.perf_counter()
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout=10)
+    except Exception:
+        results['connect_failed'] += 1
+        return
+
+    try:
+        writer.write((
+            f"GET {path} HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n"
+            f"Cookie: {cookie}\r\nConnection: keep-alive\r\n\r\n"
+        ).encode())
+        await writer.drain()
+
+        buffer = b''
+        while b'"connected"' not in buffer:
+            chunk = await asyncio.wait_for(reader.read(4096), timeout=10)
+            if not chunk:
+                results['closed_early'] += 1
+                return
+            buffer += chunk
+
+        results['ttfb'].append(time.perf_counter() - started)
+
+        deadline = time.monotonic() + hold
+        while time.monotonic() < deadline:
+            try:
+                chunk = await asyncio.wait_for(reader.read(4096), timeout=deadline - time.monotonic())
+            except asyncio.TimeoutError:
+                break
+            if not chunk:
+                results['closed_early'] += 1
+                return
+
+        results['held'] += 1
+    except Exception:
+        results['errors'] += 1
+    finally:
+        writer.close()
+
+async def run(args):
+    url = urlsplit(args.base)
+    channel = f'session:{args.session_id}:{args.user_id}:0:stream'
+    path = f'/sessions/{args.session_id}/stream?channel={quote(channel)}'
+    results = {'held': 0, 'connect_failed': 0, 'closed_early': 0, 'errors': 0, 'ttfb': []}
+
+    started = time.perf_counter()
+    await asyncio.gather(*[
+        open_stream(url.hostname, url.port or 80, path, args.cookie, args.hold, results)
+        for _ in range(args.connections)
+    ])
+    elapsed = time.perf_counter() - started
+
+    ttfb = sorted(results.pop('ttfb'))
+    print(f"connections {args.connections} in {elapsed:.1f}s")
+    for key, value in results.items():
+        print(f"  {key:15} {value}")
+    if ttfb:
+        print(f"  ttfb p50        {statistics.median(ttfb) * 1000:.1f} ms")
+        print(f"  ttfb p99        {ttfb[int(len(ttfb) * 0.99) - 1] * 1000:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--base', default='http://127.0.0.1:1337')
+    parser.add_argument('--session-id', required=True)
+    parser.add_argument('--user-id', required=True)
+    parser.add_argument('--cookie', required=True)
+    parser.add_argument('--connections', type=int, default=500)
+    parser.add_argument('--hold', type=float, default=10.0)
+    args = parser.parse_args()
+
+    asyncio.run(run(args))
+
+if __name__ == '__main__':
+    main()
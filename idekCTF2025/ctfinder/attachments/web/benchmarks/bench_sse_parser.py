@@ -0,0 +1,90 @@
+"""Microbenchmark for parsing a long upstream reply: the old iter_lines +
+decode + json.loads-every-line + string concatenation loop against
+SSEParser over the same network-sized chunks.
+
+    python benchmarks/bench_sse_parser.py --tokens 4000 --chunk 1400
+"""
+import argparse
+import html
+import json
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sessions.sse import SSEParser, load_data
+
+def build_stream(tokens):
+    events = [('message_start', {'type': 'message_start', 'message': {'id': 'msg', 'usage': {'input_tokens': 10}}}),
+              ('content_block_start', {'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}})]
+
+    for i in range(tokens):
+        if i % 200 == 0:
+            events.append(('ping', {'type': 'ping'}))
+        events.append(('content_block_delta', {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': f' word{i % 97}'}}))
+
+    events += [('content_block_stop', {'type': 'content_block_stop', 'index': 0}),
+               ('message_delta', {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'}, 'usage': {'output_tokens': tokens}}),
+               ('message_stop', {'type': 'message_stop'})]
+
+    return ''.join(f'event: {name}\ndata: {json.dumps(data)}\n\n' for name, data in events).encode()
+
+def chunked(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+def old_loop(chunks):
+    response = requests.models.Response()
+    response.iter_content = lambda chunk_size=1, decode_unicode=False: iter(chunks)
+
+    full_content = ""
+    for line in response.iter_lines():
+        if line:
+            line_text = line.decode('utf-8')
+            if line_text.startswith('data: '):
+                line_data = json.loads(line_text[6:])
+                if 'type' in line_data and line_data['type'] == 'content_block_delta':
+                    full_content += html.escape(line_data['delta']['text'])
+    return full_content
+
+def new_loop(chunks):
+    parser = SSEParser()
+    parts = []
+    for chunk in chunks:
+        for event, data in parser.feed(chunk):
+            if event == 'content_block_delta':
+                text = load_data(data)['delta'].get('text')
+                if text:
+                    parts.append(html.escape(text))
+    return ''.join(parts)
+
+def bench(fn, chunks, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn(chunks)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--tokens', type=int, nargs='+', default=[500, 4000, 16000])
+    parser.add_argument('--chunk', type=int, default=1400)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for tokens in args.tokens:
+        body = build_stream(tokens)
+        chunks = chunked(body, args.chunk)
+
+        old_time, old_result = bench(old_loop, chunks, args.repeat)
+        new_time, new_result = bench(new_loop, chunks, args.repeat)
+        assert old_result == new_result
+
+        print(f'{tokens:6} tokens {len(body) / 1024:8.0f} KiB  '
+              f'old {old_time * 1000:8.2f} ms  new {new_time * 1000:8.2f} ms  x{old_time / new_time:.2f}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Local stand-in for the messages API that streams canned replies with
+injected delays, for exercising the upstream client without a real key.
+
+A --slow-rate fraction of requests waits --slow-delay seconds between
+message_start and the first content_block_delta, the rest wait --fast-delay.
+
+    python benchmarks/stub_upstream.py --port 8089 --slow-rate 0.1 --slow-delay 5
+    ANTHROPIC_API_URL=http://127.0.0.1:8089/v1/messages python app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def sse(event, data):
+    frame = f'event: {event}\ndata: {json.dumps(data)}\n\n'.encode()
+    # chunked like the real API, so the client sees each event as it is sent
+    return b'%x\r\n%s\r\n' % (len(frame), frame)
+
+def make_handler(args):
+    class StubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *log_args):
+            pass
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+
+            with stats_lock:
+                stats['requests'] += 1
+                slow = random.random() < args.slow_rate
+                if slow:
+                    stats['slow'] += 1
+
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/event-stream')
+            self.send_header('Transfer-Encoding', 'chunked')
+            self.end_headers()
+
+            try:
+                self.wfile.write(sse('message_start', {'type': 'message_start', 'message': {'id': 'msg_stub', 'usage': {'input_tokens': 10}}}))
+                self.wfile.flush()
+
+                time.sleep(args.slow_delay if slow else args.fast_delay)
+
+                for i in range(args.tokens):
+                    self.wfile.write(sse('content_block_delta', {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': f' word{i}'}}))
+                    self.wfile.flush()
+                    time.sleep(args.token_interval)
+
+                self.wfile.write(sse('message_delta', {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'}, 'usage': {'output_tokens': args.tokens}}))
+                self.wfile.write(sse('message_stop', {'type': 'message_stop'}))
+                self.wfile.write(b'0\r\n\r\n')
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # the client hung up, e.g. a cancelled hedge
+                with stats_lock:
+                    stats['cancelled'] += 1
+
+    return StubHandler
+
+stats_lock = threading.Lock()
+stats = {'requests': 0, 'slow': 0, 'cancelled': 0}
+
+def make_server(args, host='127.0.0.1', port=0):
+    server = ThreadingHTTPServer((host, port), make_handler(args))
+    server.daemon_threads = True
+    return server
+
+def add_arguments(parser):
+    parser.add_argument('--slow-rate', type=float, default=0.1)
+    parser.add_argument('--slow-delay', type=float, default=3.0)
+    parser.add_argument('--fast-delay', type=float, default=0.05)
+    parser.add_argument('--tokens', type=int, default=20)
+    parser.add_argument('--token-interval', type=float, default=0.005)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    server = make_server(args, args.host, args.port)
+    print(f'stub upstream on http://{args.host}:{args.port}/v1/messages')
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
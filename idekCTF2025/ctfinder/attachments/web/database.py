@@ -1,22 +1,208 @@
 from flask import g
 from werkzeug.security import generate_password_hash
 import sqlite3
+import threading
 import uuid
 import os
 
-DATABASE = '/app/data/ctfinder.db'
+from migrations import run_migrations
+
+DATABASE = os.getenv('DATABASE_PATH', '/app/data/ctfinder.db')
+
+SQLITE_JOURNAL_MODE = os.getenv('SQLITE_JOURNAL_MODE', 'WAL')
+SQLITE_SYNCHRONOUS = os.getenv('SQLITE_SYNCHRONOUS', 'NORMAL')
+SQLITE_BUSY_TIMEOUT = int(os.getenv('SQLITE_BUSY_TIMEOUT', 5000))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 64 * 1024 * 1024))
+SQLITE_CACHE_SIZE = int(os.getenv('SQLITE_CACHE_SIZE', -16000))
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', 256))
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 32))
+
+
+class ConnectionPool:
+    """Keeps idle SQLite connections around so a request or stream worker can
+    check one out instead of paying connect and pragma setup every time.
+
+    A connection is owned by exactly one thread between acquire() and
+    release(); idle connections are handed out LIFO so the hottest page cache
+    and prepared-statement cache get reused first.
+    """
+
+    def __init__(self, database, max_idle=SQLITE_POOL_SIZE):
+        self.database = database
+        self.max_idle = max_idle
+        self._idle = []
+        self._lock = threading.Lock()
+        self._wal_checked = False
+        self.stats = {
+            'opened': 0,
+            'closed': 0,
+            'reused': 0,
+            'acquired': 0,
+            'released': 0,
+            'in_use': 0,
+        }
+
+    def _connect(self):
+        db = sqlite3.connect(
+            self.database,
+            timeout=SQLITE_BUSY_TIMEOUT / 1000,
+            check_same_thread=False,
+            cached_statements=SQLITE_STATEMENT_CACHE
+        )
+        db.row_factory = sqlite3.Row
+
+        db.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}')
+        db.execute(f'PRAGMA synchronous = {SQLITE_SYNCHRONOUS}')
+        db.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+        db.execute(f'PRAGMA cache_size = {SQLITE_CACHE_SIZE}')
+        db.execute('PRAGMA temp_store = MEMORY')
+
+        # journal_mode is persistent in the database file, so it only has to
+        # be switched once per process.
+        if not self._wal_checked:
+            db.execute(f'PRAGMA journal_mode = {SQLITE_JOURNAL_MODE}')
+            self._wal_checked = True
+
+        return db
+
+    def acquire(self):
+        with self._lock:
+            db = self._idle.pop() if self._idle else None
+            self.stats['acquired'] += 1
+            self.stats['in_use'] += 1
+            if db is not None:
+                self.stats['reused'] += 1
+
+        if db is None:
+            try:
+                db = self._connect()
+            except Exception:
+                with self._lock:
+                    self.stats['in_use'] -= 1
+                raise
+            with self._lock:
+                self.stats['opened'] += 1
+
+        return db
+
+    def release(self, db):
+        try:
+            if db.in_transaction:
+                db.rollback()
+        except sqlite3.Error:
+            self._discard(db)
+            return
+
+        with self._lock:
+            self.stats['released'] += 1
+            self.stats['in_use'] -= 1
+            if len(self._idle) < self.max_idle:
+                self._idle.append(db)
+                return
+            self.stats['closed'] += 1
+
+        db.close()
+
+    def _discard(self, db):
+        with self._lock:
+            self.stats['released'] += 1
+            self.stats['in_use'] -= 1
+            self.stats['closed'] += 1
+        try:
+            db.close()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            self.stats['closed'] += len(idle)
+
+        for db in idle:
+            db.close()
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self.stats, idle=len(self._idle), max_idle=self.max_idle)
+
+
+pool = ConnectionPool(DATABASE)
 
 def get_db():
     db = getattr(g, '_database', None)
     if db is None:
-        db = g._database = sqlite3.connect(DATABASE)
-        db.row_factory = sqlite3.Row
+        db = g._database = pool.acquire()
     return db
 
 def close_db(error):
     db = getattr(g, '_database', None)
     if db is not None:
-        db.close()
+        g._database = None
+        pool.release(db)
+
+def get_pool_stats():
+    return pool.get_stats()
+
+def create_tables(db):
+    """Create the base tables; indexes and later columns live in migrations"""
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id TEXT PRIMARY KEY NOT NULL,
+            username TEXT NOT NULL UNIQUE,
+            password TEXT NOT NULL,
+            is_admin BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS tokens (
+            id TEXT PRIMARY KEY NOT NULL,
+            token TEXT NOT NULL UNIQUE,
+            user_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS sessions (
+            id TEXT PRIMARY KEY NOT NULL,
+            title TEXT DEFAULT 'New Session',
+            user_id TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS messages (
+            id TEXT PRIMARY KEY NOT NULL,
+            session_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            role TEXT CHECK(role IN ('user', 'assistant')) NOT NULL,
+            content TEXT NOT NULL,
+            token_count INTEGER NOT NULL,
+            parent_id TEXT,
+            sequence_id INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES sessions (id),
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (parent_id) REFERENCES messages (id)
+        )
+    ''')
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS report_logs (
+            id TEXT PRIMARY KEY NOT NULL,
+            user_id TEXT NOT NULL,
+            admin_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            message_id TEXT NOT NULL,
+            report_message TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (session_id) REFERENCES sessions (id),
+            FOREIGN KEY (admin_id) REFERENCES users (id)
+        )
+    ''')
+    db.commit()
 
 def init_db(app):
     """Initialize the database with required tables"""
@@ -24,64 +210,8 @@ def init_db(app):
     os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
     with app.app_context():
         db = get_db()
-        db.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id TEXT PRIMARY KEY NOT NULL,
-                username TEXT NOT NULL UNIQUE,
-                password TEXT NOT NULL,
-                is_admin BOOLEAN DEFAULT FALSE,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        db.execute('''
-            CREATE TABLE IF NOT EXISTS tokens (
-                id TEXT PRIMARY KEY NOT NULL,
-                token TEXT NOT NULL UNIQUE,
-                user_id TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        db.execute('''
-            CREATE TABLE IF NOT EXISTS sessions (
-                id TEXT PRIMARY KEY NOT NULL,
-                title TEXT DEFAULT 'New Session',
-                user_id TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        db.execute('''
-            CREATE TABLE IF NOT EXISTS messages (
-                id TEXT PRIMARY KEY NOT NULL,
-                session_id TEXT NOT NULL,
-                user_id TEXT NOT NULL,
-                role TEXT CHECK(role IN ('user', 'assistant')) NOT NULL,
-                content TEXT NOT NULL,
-                token_count INTEGER NOT NULL,
-                parent_id TEXT,
-                sequence_id INTEGER NOT NULL DEFAULT 0,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (session_id) REFERENCES sessions (id),
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (parent_id) REFERENCES messages (id)
-            )
-        ''')
-        db.execute('''
-            CREATE TABLE IF NOT EXISTS report_logs (
-                id TEXT PRIMARY KEY NOT NULL,
-                user_id TEXT NOT NULL,
-                admin_id TEXT NOT NULL,
-                session_id TEXT NOT NULL,
-                message_id TEXT NOT NULL,
-                report_message TEXT NOT NULL,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id),
-                FOREIGN KEY (session_id) REFERENCES sessions (id),
-                FOREIGN KEY (admin_id) REFERENCES users (id)
-            )
-        ''')
-        db.commit()
+        create_tables(db)
+        run_migrations(db)
 
         db.execute("INSERT OR IGNORE INTO users (id, username, password, is_admin) VALUES (?, ?, ?, ?)", (
             str(uuid.uuid4()), 
@@ -89,4 +219,20 @@ def init_db(app):
             generate_password_hash(os.getenv("ADMIN_PASSWORD")), 
             True
         ))
-        db.commit()
\ No newline at end of file
+        db.commit()
+
+def init_db_locked(app):
+    """init_db for servers that boot several worker processes at once.
+
+    The workers take an exclusive lock on a file next to the database, so
+    table creation, migrations and the admin insert run one worker at a
+    time; the ones that follow find everything in place.
+    """
+    import fcntl
+    os.makedirs(os.path.dirname(DATABASE), exist_ok=True)
+    with open(f'{DATABASE}.init.lock', 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            init_db(app)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
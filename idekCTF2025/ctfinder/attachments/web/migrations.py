@@ -0,0 +1,110 @@
+import hashlib
+import sqlite3
+
+# The applied schema version is kept in PRAGMA user_version, so a migration
+# only ever runs once per database file. Append new migrations to the end of
+# MIGRATIONS with the next version number; never edit one that has shipped.
+
+def add_column(table, column, definition):
+    """Migration step that adds a column unless a previous run already did"""
+    def step(db):
+        columns = [row[1] for row in db.execute(f'PRAGMA table_info({table})').fetchall()]
+        if column not in columns:
+            db.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+    return step
+
+def report_content_hash_v3(user_id, report_message):
+    """report_content_hash as of migration 3, frozen here so the backfill
+    keeps producing the same hashes if admins.utils ever changes it."""
+    return hashlib.sha256(f'{user_id}\0{report_message}'.encode()).hexdigest()
+
+def backfill_report_hashes(db):
+    """Fill report_logs.content_hash; where earlier rows already share a
+    hash, only the oldest gets it and the rest keep NULL, so the unique
+    index can be built without deleting any report."""
+    seen = set()
+    updates = []
+
+    for report_id, user_id, report_message in db.execute(
+        'SELECT id, user_id, report_message FROM report_logs WHERE content_hash IS NULL ORDER BY created_at, id'
+    ):
+        content_hash = report_content_hash_v3(user_id, report_message)
+        if content_hash not in seen:
+            seen.add(content_hash)
+            updates.append((content_hash, report_id))
+
+    db.executemany('UPDATE report_logs SET content_hash = ? WHERE id = ?', updates)
+
+MIGRATIONS = [
+    (1, 'hot path indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_messages_session_sequence ON messages (session_id, sequence_id)',
+        'CREATE INDEX IF NOT EXISTS idx_sessions_user ON sessions (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_tokens_user ON tokens (user_id)',
+        'CREATE INDEX IF NOT EXISTS idx_report_logs_session ON report_logs (session_id)',
+    ]),
+    (2, 'per-session sequence counter', [
+        add_column('sessions', 'last_sequence_id', 'INTEGER NOT NULL DEFAULT 0'),
+        '''
+        UPDATE sessions SET last_sequence_id = COALESCE(
+            (SELECT MAX(sequence_id) FROM messages WHERE messages.session_id = sessions.id), 0
+        )
+        ''',
+    ]),
+    (3, 'report log dedupe and paging', [
+        add_column('report_logs', 'content_hash', 'TEXT'),
+        backfill_report_hashes,
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_report_logs_content_hash ON report_logs (content_hash)',
+        'CREATE INDEX IF NOT EXISTS idx_report_logs_created ON report_logs (created_at, id)',
+        'CREATE INDEX IF NOT EXISTS idx_report_logs_user_created ON report_logs (user_id, created_at, id)',
+    ]),
+]
+
+def get_schema_version(db):
+    return db.execute('PRAGMA user_version').fetchone()[0]
+
+def run_migrations(db, migrations=None):
+    """Apply every pending migration, one transaction per version"""
+    migrations = MIGRATIONS if migrations is None else migrations
+    applied = []
+
+    for version, name, steps in migrations:
+        if get_schema_version(db) >= version:
+            continue
+
+        # BEGIN IMMEDIATE takes the write lock up front, so when several
+        # workers boot at once only one applies the migration and the rest
+        # see the bumped version once they get the lock.
+        if db.in_transaction:
+            db.commit()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            if get_schema_version(db) >= version:
+                db.rollback()
+                continue
+
+            for step in steps:
+                if callable(step):
+                    step(db)
+                else:
+                    db.execute(step)
+
+            db.execute(f'PRAGMA user_version = {int(version)}')
+            db.commit()
+        except sqlite3.Error:
+            db.rollback()
+            raise
+
+        applied.append((version, name))
+
+    return applied
+
+if __name__ == '__main__':
+    from database import DATABASE
+
+    db = sqlite3.connect(DATABASE, timeout=30)
+    applied = run_migrations(db)
+
+    for version, name in applied:
+        print(f'applied {version}: {name}')
+    print(f'schema version {get_schema_version(db)}')
+    db.close()
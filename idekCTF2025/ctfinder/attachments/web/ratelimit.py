@@ -0,0 +1,170 @@
+import math
+import os
+import threading
+
+import redis as redis_lib
+
+from redis_config import get_redis
+
+# Defaults for the buckets; the live values sit in the ratelimit:config hash
+# and can be changed at runtime through PUT /admin/ratelimit. A rate of 0
+# turns that bucket off.
+RATE_LIMIT_USER_RATE = float(os.getenv('RATE_LIMIT_USER_RATE', 0.2))
+RATE_LIMIT_USER_BURST = float(os.getenv('RATE_LIMIT_USER_BURST', 5))
+RATE_LIMIT_GLOBAL_RATE = float(os.getenv('RATE_LIMIT_GLOBAL_RATE', 10))
+RATE_LIMIT_GLOBAL_BURST = float(os.getenv('RATE_LIMIT_GLOBAL_BURST', 50))
+
+CONFIG_KEY = 'ratelimit:config'
+GLOBAL_KEY = 'ratelimit:global'
+CONFIG_FIELDS = ('user_rate', 'user_burst', 'global_rate', 'global_burst')
+
+# KEYS: config hash, user bucket, global bucket
+# ARGV: default user_rate, user_burst, global_rate, global_burst, cost
+#
+# Shared by both scripts: reads the live limits and refills a bucket to now.
+BUCKET_PRELUDE = """
+local config = redis.call('HMGET', KEYS[1], 'user_rate', 'user_burst', 'global_rate', 'global_burst')
+local limits = {}
+for i = 1, 4 do
+    limits[i] = tonumber(config[i]) or tonumber(ARGV[i])
+end
+local cost = tonumber(ARGV[5])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local function refill(key, rate, burst)
+    if rate <= 0 then
+        return nil
+    end
+    local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(bucket[1]) or burst
+    local ts = tonumber(bucket[2]) or now
+    return math.min(burst, tokens + math.max(0, now - ts) * rate / 1000)
+end
+
+local function store(key, tokens, rate, burst)
+    if tokens then
+        redis.call('HSET', key, 'tokens', tokens, 'ts', now)
+        redis.call('PEXPIRE', key, math.ceil(burst * 1000 / rate) + 1000)
+    end
+end
+
+local user_tokens = refill(KEYS[2], limits[1], limits[2])
+local global_tokens = refill(KEYS[3], limits[3], limits[4])
+"""
+
+# Both buckets are refilled to now, and the request is admitted only if both
+# hold cost tokens, so a user rejected by their own bucket never spends
+# global capacity. Returns {admitted, retry_after_ms, scope}.
+TOKEN_BUCKET_SCRIPT = BUCKET_PRELUDE + """
+local function wait_ms(tokens, rate)
+    return math.ceil((cost - tokens) * 1000 / rate)
+end
+
+if user_tokens and user_tokens < cost then
+    return {0, wait_ms(user_tokens, limits[1]), 'user'}
+end
+if global_tokens and global_tokens < cost then
+    return {0, wait_ms(global_tokens, limits[3]), 'global'}
+end
+
+if user_tokens then
+    store(KEYS[2], user_tokens - cost, limits[1], limits[2])
+end
+if global_tokens then
+    store(KEYS[3], global_tokens - cost, limits[3], limits[4])
+end
+
+return {1, 0, ''}
+"""
+
+# Gives back what an admitted request spent, capped at the burst, for a
+# request that was turned away after admit().
+REFUND_SCRIPT = BUCKET_PRELUDE + """
+if user_tokens then
+    store(KEYS[2], math.min(limits[2], user_tokens + cost), limits[1], limits[2])
+end
+if global_tokens then
+    store(KEYS[3], math.min(limits[4], global_tokens + cost), limits[3], limits[4])
+end
+"""
+
+_stats_lock = threading.Lock()
+rate_limit_stats = {
+    'admitted': 0,
+    'rejected_user': 0,
+    'rejected_global': 0,
+    'refunded': 0,
+    'errors': 0,
+}
+
+_scripts = {}
+
+def get_script(source=TOKEN_BUCKET_SCRIPT):
+    if source not in _scripts:
+        _scripts[source] = get_redis().register_script(source)
+    return _scripts[source]
+
+def bucket_keys(user_id):
+    return [CONFIG_KEY, f'ratelimit:user:{user_id}', GLOBAL_KEY]
+
+def bucket_args(cost):
+    return [RATE_LIMIT_USER_RATE, RATE_LIMIT_USER_BURST, RATE_LIMIT_GLOBAL_RATE, RATE_LIMIT_GLOBAL_BURST, cost]
+
+def admit(user_id, cost=1):
+    """Take cost tokens from the user's and the global bucket.
+
+    Returns (admitted, retry_after) with retry_after in whole seconds. Fails
+    open: if Redis is unreachable the request goes through and the error is
+    counted, so an outage of the limiter is not an outage of the app.
+    """
+    try:
+        admitted, retry_after_ms, scope = get_script()(keys=bucket_keys(user_id), args=bucket_args(cost), client=get_redis())
+    except redis_lib.RedisError:
+        with _stats_lock:
+            rate_limit_stats['errors'] += 1
+        return True, 0
+
+    with _stats_lock:
+        if admitted:
+            rate_limit_stats['admitted'] += 1
+        else:
+            rate_limit_stats[f'rejected_{scope}'] += 1
+
+    if admitted:
+        return True, 0
+
+    return False, max(1, math.ceil(retry_after_ms / 1000))
+
+def refund(user_id, cost=1):
+    """Give back what admit() took, for a request that was turned away
+    before it did any work."""
+    try:
+        get_script(REFUND_SCRIPT)(keys=bucket_keys(user_id), args=bucket_args(cost), client=get_redis())
+    except redis_lib.RedisError:
+        with _stats_lock:
+            rate_limit_stats['errors'] += 1
+        return
+
+    with _stats_lock:
+        rate_limit_stats['refunded'] += 1
+
+def get_limits():
+    config = get_redis().hgetall(CONFIG_KEY)
+    defaults = {
+        'user_rate': RATE_LIMIT_USER_RATE,
+        'user_burst': RATE_LIMIT_USER_BURST,
+        'global_rate': RATE_LIMIT_GLOBAL_RATE,
+        'global_burst': RATE_LIMIT_GLOBAL_BURST,
+    }
+
+    return {field: float(config.get(field, defaults[field])) for field in CONFIG_FIELDS}
+
+def set_limits(limits):
+    """Store new limits; they apply from the next admit() in every worker."""
+    get_redis().hset(CONFIG_KEY, mapping={field: float(limits[field]) for field in CONFIG_FIELDS if field in limits})
+
+def get_rate_limit_stats():
+    with _stats_lock:
+        return dict(rate_limit_stats)
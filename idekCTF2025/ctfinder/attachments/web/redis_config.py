@@ -34,4 +34,25 @@ def get_redis():
     return redis_client
 
 def get_pubsub_redis():
-    return pubsub_redis_client
\ No newline at end of file
+    return pubsub_redis_client
+
+async_pubsub_redis_client = None
+
+def get_async_pubsub_redis():
+    # Created on first use so the asyncio client only exists in the ASGI process
+    global async_pubsub_redis_client
+    if async_pubsub_redis_client is None:
+        import redis.asyncio
+        async_pubsub_redis_client = redis.asyncio.Redis(
+            host=REDIS_HOST,
+            port=REDIS_PORT,
+            db=REDIS_DB,
+            password=REDIS_PASSWORD,
+            decode_responses=True,
+            socket_connect_timeout=10,
+            socket_timeout=None,
+            retry_on_timeout=True,
+            socket_keepalive=True,
+            max_connections=int(os.getenv('REDIS_ASYNC_MAX_CONNECTIONS', 10000))
+        )
+    return async_pubsub_redis_client
@@ -0,0 +1,36 @@
+"""Production entry point: uvicorn running asgi:application in
+SERVER_WORKERS processes.
+
+    python serve.py
+
+Each process serves /sessions/<id>/stream on its event loop and the rest of
+the Flask app on the a2wsgi thread pool (ASGI_WSGI_THREADS). Workers run
+init_db at startup under a file lock, so only one of them creates the schema
+and applies migrations. On SIGTERM the server stops accepting connections,
+gives open requests and streams up to SERVER_GRACEFUL_TIMEOUT to finish, then
+waits up to STREAM_DRAIN_TIMEOUT for stream jobs that are still running.
+"""
+import os
+
+import uvicorn
+
+SERVER_HOST = os.getenv('SERVER_HOST', '0.0.0.0')
+SERVER_PORT = int(os.getenv('SERVER_PORT', 1337))
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', 4))
+SERVER_GRACEFUL_TIMEOUT = int(os.getenv('SERVER_GRACEFUL_TIMEOUT', 25))
+SERVER_BACKLOG = int(os.getenv('SERVER_BACKLOG', 2048))
+
+def main():
+    uvicorn.run(
+        'asgi:application',
+        host=SERVER_HOST,
+        port=SERVER_PORT,
+        workers=SERVER_WORKERS,
+        lifespan='on',
+        timeout_graceful_shutdown=SERVER_GRACEFUL_TIMEOUT,
+        backlog=SERVER_BACKLOG,
+        access_log=False,
+    )
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,45 @@
+import hashlib
+import json
+import os
+
+from cache import TTLCache
+
+COMPLETION_CACHE = os.getenv('COMPLETION_CACHE', '0') == '1'
+COMPLETION_CACHE_SIZE = int(os.getenv('COMPLETION_CACHE_SIZE', 1000))
+COMPLETION_CACHE_TTL = int(os.getenv('COMPLETION_CACHE_TTL', 3600))
+COMPLETION_REPLAY_CHARS = int(os.getenv('COMPLETION_REPLAY_CHARS', 64))
+
+completion_cache = TTLCache(COMPLETION_CACHE_SIZE, COMPLETION_CACHE_TTL)
+
+def completion_key(request_body, api_key):
+    """Hash of everything in the request that shapes the reply, scoped to the
+    caller's API key.
+
+    stream only changes the framing, so it is left out. A hit never reaches
+    the upstream, so without the key a user with an invalid or revoked token
+    would be served replies another user's key paid for; an entry is only
+    reused for the key that produced it.
+    """
+    body = {key: value for key, value in request_body.items() if key != 'stream'}
+    scope = hashlib.sha256((api_key or '').encode()).hexdigest()
+    payload = json.dumps(body, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f'{scope}:{payload}'.encode()).hexdigest()
+
+def get_cached_completion(request_body, api_key):
+    """Return (content, token_count) for a cached reply, or None."""
+    if not COMPLETION_CACHE or not api_key:
+        return None
+
+    return completion_cache.get(completion_key(request_body, api_key))
+
+def store_completion(request_body, api_key, content, token_count):
+    if COMPLETION_CACHE and api_key and content:
+        completion_cache.set(completion_key(request_body, api_key), (content, token_count))
+
+def replay_chunks(content, size=COMPLETION_REPLAY_CHARS):
+    """Split a cached reply into delta-sized pieces for the publisher"""
+    for start in range(0, len(content), size):
+        yield content[start:start + size]
+
+def get_completion_cache_stats():
+    return dict(completion_cache.get_stats(), enabled=COMPLETION_CACHE)
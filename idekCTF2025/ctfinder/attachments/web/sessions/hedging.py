@@ -0,0 +1,194 @@
+import os
+import queue
+import threading
+import time
+
+from upstream import abort_response
+
+UPSTREAM_HEDGE = os.getenv('UPSTREAM_HEDGE', '0') == '1'
+UPSTREAM_HEDGE_AFTER_MS = float(os.getenv('UPSTREAM_HEDGE_AFTER_MS', 2000))
+
+_stats_lock = threading.Lock()
+hedge_stats = {
+    'requests': 0,
+    'hedged': 0,
+    'hedge_wins': 0,
+    'failed_attempts': 0,
+    'ttft_count': 0,
+    'ttft_total': 0.0,
+    'ttft_max': 0.0,
+}
+
+
+class Attempt:
+    """One upstream request running on its own thread.
+
+    start() returns (response, reply) where reply yields the
+    iter_upstream_reply pairs; everything the attempt produces goes onto the
+    shared events queue tagged with the attempt, so the caller can wait on
+    all attempts at once.
+    """
+
+    def __init__(self, index, start, events):
+        self.index = index
+        self.response = None
+        self._start = start
+        self._events = events
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f'hedge-{index}', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            response, reply = self._start()
+        except Exception as e:
+            self._events.put((self, 'exception', e))
+            return
+
+        self.response = response
+        if self._cancelled.is_set():
+            response.close()
+            return
+
+        if not response.ok:
+            self._events.put((self, 'failed', None))
+            return
+
+        try:
+            for item in reply:
+                if self._cancelled.is_set():
+                    return
+                self._events.put((self, 'item', item))
+        except Exception as e:
+            if not self._cancelled.is_set():
+                self._events.put((self, 'exception', e))
+            return
+
+        self._events.put((self, 'done', None))
+
+    def cancel(self):
+        self._cancelled.set()
+
+        # a read stuck on the socket fails and the thread exits quietly;
+        # close() then hands the connection slot back to the session's pool,
+        # which a response that failed before its body was read never does
+        # on its own
+        if self.response is not None:
+            try:
+                abort_response(self.response)
+            except Exception:
+                pass
+            try:
+                self.response.close()
+            except Exception:
+                pass
+
+
+def hedged_reply(start, hedge_after_ms=UPSTREAM_HEDGE_AFTER_MS):
+    """Run start() and, if no delta has come back within hedge_after_ms,
+    run it a second time; the first attempt to produce a delta wins and the
+    other one is cancelled.
+
+    Returns (response, reply) like a single attempt would. An attempt that
+    fails before its first delta (HTTP error, error event, exception) only
+    decides the outcome once no other attempt is left to wait for.
+    """
+    events = queue.Queue()
+    deadline = time.monotonic() + hedge_after_ms / 1000
+    attempts = [Attempt(0, start, events)]
+    pending = {0}
+    buffered = {0: []}
+    winner = None
+    failure = None
+
+    with _stats_lock:
+        hedge_stats['requests'] += 1
+
+    while pending:
+        timeout = max(0, deadline - time.monotonic()) if len(attempts) == 1 else None
+
+        try:
+            attempt, kind, value = events.get(timeout=timeout)
+        except queue.Empty:
+            attempts.append(Attempt(1, start, events))
+            pending.add(1)
+            buffered[1] = []
+            with _stats_lock:
+                hedge_stats['hedged'] += 1
+            continue
+
+        if attempt.index not in pending:
+            continue
+
+        if kind == 'item':
+            buffered[attempt.index].append(value)
+            if value[0] == 'delta':
+                winner = attempt
+                break
+            if value[0] != 'error':
+                continue
+
+        elif kind == 'done':
+            winner = attempt
+            break
+
+        # failed before its first delta, wait on whatever is still running
+        pending.discard(attempt.index)
+        failure = (attempt, kind, value)
+        with _stats_lock:
+            hedge_stats['failed_attempts'] += 1
+
+    # cancels the losers and releases the connections of attempts that failed
+    keep = winner if winner is not None else failure[0]
+    for attempt in attempts:
+        if attempt is not keep:
+            attempt.cancel()
+
+    if winner is None:
+        attempt, kind, value = failure
+        if kind == 'exception':
+            raise value
+        return attempt.response, iter(buffered[attempt.index])
+
+    if winner.index:
+        with _stats_lock:
+            hedge_stats['hedge_wins'] += 1
+
+    return winner.response, follow(winner, buffered[winner.index], events)
+
+def follow(winner, buffered, events):
+    finished = False
+
+    try:
+        yield from buffered
+
+        while True:
+            attempt, kind, value = events.get()
+            if attempt is not winner:
+                continue
+
+            if kind == 'item':
+                yield value
+            elif kind == 'done':
+                finished = True
+                return
+            elif kind == 'exception':
+                finished = True
+                raise value
+    finally:
+        if not finished:
+            winner.cancel()
+
+def record_ttft(seconds):
+    with _stats_lock:
+        hedge_stats['ttft_count'] += 1
+        hedge_stats['ttft_total'] += seconds
+        hedge_stats['ttft_max'] = max(hedge_stats['ttft_max'], seconds)
+
+def get_hedge_stats():
+    with _stats_lock:
+        stats = dict(hedge_stats, enabled=UPSTREAM_HEDGE, hedge_after_ms=UPSTREAM_HEDGE_AFTER_MS)
+
+    stats['hedge_rate'] = stats['hedged'] / stats['requests'] if stats['requests'] else 0.0
+    stats['ttft_avg'] = stats['ttft_total'] / stats['ttft_count'] if stats['ttft_count'] else 0.0
+    return stats
@@ -0,0 +1,180 @@
+import json
+import os
+
+import redis as redis_lib
+
+from sessions.versions import version_key
+
+HISTORY_WINDOW = int(os.getenv('HISTORY_WINDOW', 10))
+HISTORY_TTL = int(os.getenv('HISTORY_TTL', 3600))
+# 0 sends the whole window
+HISTORY_TOKEN_BUDGET = int(os.getenv('HISTORY_TOKEN_BUDGET', 8000))
+HISTORY_CHARS_PER_TOKEN = int(os.getenv('HISTORY_CHARS_PER_TOKEN', 4))
+
+history_stats = {
+    'hits': 0,
+    'misses': 0,
+    'populated': 0,
+    'populate_conflicts': 0,
+    'append_conflicts': 0,
+    'errors': 0,
+}
+
+budget_stats = {
+    'requests': 0,
+    'trimmed_requests': 0,
+    'messages_available': 0,
+    'messages_sent': 0,
+    'tokens_available': 0,
+    'tokens_sent': 0,
+    'chars_available': 0,
+    'chars_sent': 0,
+}
+
+def history_key(session_id, user_id):
+    return f"session:{session_id}:{user_id}:history"
+
+def as_messages(entries):
+    return [{'role': entry['role'], 'content': entry['content']} for entry in entries]
+
+def estimate_tokens(entry):
+    # assistant rows carry the upstream output_tokens, user rows are stored as 0
+    if entry.get('token_count'):
+        return entry['token_count']
+    return len(entry['content']) // HISTORY_CHARS_PER_TOKEN + 1
+
+def pack_history(entries, budget=None):
+    """Pick the newest entries that fit in budget tokens, oldest first.
+
+    Leading assistant entries are dropped afterwards because the messages API
+    wants the conversation to open with a user turn; an empty history is fine,
+    the new user message still goes out on its own.
+    """
+    budget = HISTORY_TOKEN_BUDGET if budget is None else budget
+
+    tokens = [estimate_tokens(entry) for entry in entries]
+    start = len(entries)
+    used = 0
+
+    while start > 0 and (not budget or used + tokens[start - 1] <= budget):
+        start -= 1
+        used += tokens[start]
+
+    while start < len(entries) and entries[start]['role'] != 'user':
+        used -= tokens[start]
+        start += 1
+
+    packed = entries[start:]
+
+    budget_stats['requests'] += 1
+    budget_stats['trimmed_requests'] += 1 if start else 0
+    budget_stats['messages_available'] += len(entries)
+    budget_stats['messages_sent'] += len(packed)
+    budget_stats['tokens_available'] += sum(tokens)
+    budget_stats['tokens_sent'] += used
+    budget_stats['chars_available'] += sum(len(entry['content']) for entry in entries)
+    budget_stats['chars_sent'] += sum(len(entry['content']) for entry in packed)
+
+    return as_messages(packed)
+
+def read_history(redis, session_id, user_id):
+    """Return the cached window oldest first, or None on a miss."""
+    try:
+        entries = redis.lrange(history_key(session_id, user_id), 0, -1)
+    except redis_lib.RedisError:
+        history_stats['errors'] += 1
+        return None
+
+    if not entries:
+        history_stats['misses'] += 1
+        return None
+
+    history_stats['hits'] += 1
+    return [json.loads(entry) for entry in entries]
+
+def append_history(redis, session_id, user_id, entries):
+    """Write committed messages through to the window.
+
+    entries are dicts with sequence_id, role, content and token_count. Only
+    a window that is already there is appended to, so one is never started
+    from the middle of a conversation; a missing one is built from SQLite by
+    populate_history on the next read. Entries at or below the window's last sequence_id are
+    skipped, since a populate that ran after the commit already has them.
+    """
+    key = history_key(session_id, user_id)
+
+    try:
+        with redis.pipeline() as pipe:
+            for _ in range(3):
+                try:
+                    pipe.watch(key)
+                    last = pipe.lindex(key, -1)
+                    if last is None:
+                        return
+
+                    last_sequence_id = json.loads(last)['sequence_id']
+                    new_entries = [entry for entry in entries if entry['sequence_id'] > last_sequence_id]
+                    if not new_entries:
+                        return
+
+                    pipe.multi()
+                    pipe.rpush(key, *[json.dumps(entry) for entry in new_entries])
+                    pipe.ltrim(key, -HISTORY_WINDOW, -1)
+                    pipe.expire(key, HISTORY_TTL)
+                    pipe.execute()
+                    return
+                except redis_lib.WatchError:
+                    history_stats['append_conflicts'] += 1
+
+        # still contended, let the next read rebuild it
+        drop_history(redis, session_id, user_id)
+    except redis_lib.RedisError:
+        history_stats['errors'] += 1
+        drop_history(redis, session_id, user_id)
+
+def populate_history(redis, session_id, user_id, load):
+    """Fill the window from load() and return what load() returned.
+
+    Runs under WATCH on the session version, which save_messages_to_db bumps
+    after every commit and before append_history, so a save landing between
+    the SQLite read and the write-back aborts the write-back instead of
+    caching a window that misses it.
+    """
+    entries = None
+
+    try:
+        with redis.pipeline() as pipe:
+            pipe.watch(version_key(session_id))
+            entries = load()
+
+            if entries:
+                key = history_key(session_id, user_id)
+                pipe.multi()
+                pipe.delete(key)
+                pipe.rpush(key, *[json.dumps(entry) for entry in entries])
+                pipe.expire(key, HISTORY_TTL)
+                pipe.execute()
+                history_stats['populated'] += 1
+
+            return entries
+    except redis_lib.WatchError:
+        history_stats['populate_conflicts'] += 1
+        return load()
+    except redis_lib.RedisError:
+        history_stats['errors'] += 1
+        return entries if entries is not None else load()
+
+def drop_history(redis, session_id, user_id):
+    try:
+        redis.delete(history_key(session_id, user_id))
+    except redis_lib.RedisError:
+        history_stats['errors'] += 1
+
+def get_history_stats():
+    return dict(history_stats)
+
+def get_budget_stats():
+    stats = dict(budget_stats, budget=HISTORY_TOKEN_BUDGET)
+    stats['tokens_saved'] = stats['tokens_available'] - stats['tokens_sent']
+    stats['chars_saved'] = stats['chars_available'] - stats['chars_sent']
+    return stats
@@ -0,0 +1,253 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+from redis_config import get_redis
+from sessions.workers import StreamQueueFull, UserLimitReached, STREAM_MAX_PER_USER
+
+# 'thread' runs turns on the in-process StreamExecutor, 'queue' hands them
+# to `python worker.py` through the Redis queue below
+STREAM_BACKEND = os.getenv('STREAM_BACKEND', 'thread')
+JOB_QUEUE_MAX = int(os.getenv('JOB_QUEUE_MAX', 1000))
+JOB_VISIBILITY_TIMEOUT = int(os.getenv('JOB_VISIBILITY_TIMEOUT', 60))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', 3))
+# safety net for a per-user count that missed its decrement
+JOB_USER_TTL = int(os.getenv('JOB_USER_TTL', 3600))
+
+PENDING_KEY = 'stream:jobs:pending'
+PROCESSING_KEY = 'stream:jobs:processing'
+DEADLINES_KEY = 'stream:jobs:deadlines'
+DATA_KEY = 'stream:jobs:data'
+ATTEMPTS_KEY = 'stream:jobs:attempts'
+DEAD_KEY = 'stream:jobs:dead'
+USERS_KEY = 'stream:jobs:users'
+USER_PREFIX = 'stream:jobs:user:'
+
+def user_key(user_id):
+    return f'{USER_PREFIX}{user_id}'
+
+# Gives back the job's slot in its user's in-flight count, once: the job's
+# entry in the users hash goes with the first release.
+RELEASE_USER = """
+local function release_user(users, job_id)
+    local user_id = redis.call('HGET', users, job_id)
+    if user_id then
+        redis.call('HDEL', users, job_id)
+        if redis.call('DECR', ARGV[1] .. user_id) <= 0 then
+            redis.call('DEL', ARGV[1] .. user_id)
+        end
+    end
+end
+"""
+
+# KEYS: processing, deadlines, attempts, pending, dead, users
+# ARGV: user key prefix, max_attempts, job ids...
+#
+# Moves jobs out of processing in one step, so a job is never in both lists
+# or in neither. Jobs that have used up their attempts go to the dead list.
+# Returns the ids that were dead-lettered.
+RETRY_SCRIPT = RELEASE_USER + """
+local dead = {}
+for i = 3, #ARGV do
+    local job_id = ARGV[i]
+    if redis.call('LREM', KEYS[1], 1, job_id) > 0 then
+        redis.call('ZREM', KEYS[2], job_id)
+        local attempts = redis.call('HINCRBY', KEYS[3], job_id, 1)
+        if attempts >= tonumber(ARGV[2]) then
+            redis.call('LPUSH', KEYS[5], job_id)
+            release_user(KEYS[6], job_id)
+            table.insert(dead, job_id)
+        else
+            redis.call('RPUSH', KEYS[4], job_id)
+        end
+    end
+end
+return dead
+"""
+
+# KEYS: processing, deadlines, data, attempts, users
+# ARGV: user key prefix, job id
+ACK_SCRIPT = RELEASE_USER + """
+local job_id = ARGV[2]
+redis.call('LREM', KEYS[1], 1, job_id)
+redis.call('ZREM', KEYS[2], job_id)
+redis.call('HDEL', KEYS[3], job_id)
+redis.call('HDEL', KEYS[4], job_id)
+release_user(KEYS[5], job_id)
+"""
+
+_stats_lock = threading.Lock()
+queue_stats = {
+    'enqueued': 0,
+    'rejected_full': 0,
+    'rejected_user': 0,
+}
+
+_scripts = {}
+
+def get_script(redis, source):
+    # registered once; each call passes its own client, so the script is
+    # not tied to whichever connection registered it
+    if source not in _scripts:
+        _scripts[source] = redis.register_script(source)
+    return _scripts[source]
+
+
+class Job:
+    def __init__(self, job_id, payload, attempts):
+        self.id = job_id
+        self.payload = payload
+        self.attempts = attempts
+
+
+def enqueue_turn(session_id, user_id, content, message_id, stream_channel, redis=None):
+    """Queue one stream_claude_response call for the worker tier.
+
+    Raises StreamQueueFull once JOB_QUEUE_MAX jobs are waiting and
+    UserLimitReached once the user has STREAM_MAX_PER_USER jobs queued or
+    running, like the in-process executor does.
+    """
+    redis = redis or get_redis()
+
+    if redis.llen(PENDING_KEY) >= JOB_QUEUE_MAX:
+        with _stats_lock:
+            queue_stats['rejected_full'] += 1
+        raise StreamQueueFull()
+
+    # counted from enqueue until ack or dead-letter, across every web process
+    pipe = redis.pipeline()
+    pipe.incr(user_key(user_id))
+    pipe.expire(user_key(user_id), JOB_USER_TTL)
+    in_flight = pipe.execute()[0]
+
+    if STREAM_MAX_PER_USER and in_flight > STREAM_MAX_PER_USER:
+        redis.decr(user_key(user_id))
+        with _stats_lock:
+            queue_stats['rejected_user'] += 1
+        raise UserLimitReached()
+
+    job_id = str(uuid.uuid4())
+    payload = json.dumps({
+        'session_id': session_id,
+        'user_id': user_id,
+        'content': content,
+        'message_id': message_id,
+        'stream_channel': stream_channel,
+        'enqueued_at': time.time()
+    })
+
+    pipe = redis.pipeline()
+    pipe.hset(DATA_KEY, job_id, payload)
+    pipe.hset(USERS_KEY, job_id, user_id)
+    pipe.lpush(PENDING_KEY, job_id)
+    pipe.execute()
+
+    with _stats_lock:
+        queue_stats['enqueued'] += 1
+
+    return job_id
+
+def reserve(redis, timeout=1):
+    """Claim the oldest pending job, or return None after timeout seconds.
+
+    The job stays in the processing list with a deadline until it is acked;
+    if the deadline passes first, requeue_expired hands it to another worker.
+    """
+    job_id = redis.blmove(PENDING_KEY, PROCESSING_KEY, timeout, 'RIGHT', 'LEFT')
+    if job_id is None:
+        return None
+
+    redis.zadd(DEADLINES_KEY, {job_id: time.time() + JOB_VISIBILITY_TIMEOUT})
+
+    pipe = redis.pipeline()
+    pipe.hget(DATA_KEY, job_id)
+    pipe.hget(ATTEMPTS_KEY, job_id)
+    payload, attempts = pipe.execute()
+
+    if payload is None:
+        # acked or purged under us, nothing left to run
+        ack(redis, job_id)
+        return None
+
+    return Job(job_id, json.loads(payload), int(attempts or 0))
+
+def extend(redis, job_ids):
+    """Push the deadlines of running jobs out by another visibility timeout"""
+    if job_ids:
+        deadline = time.time() + JOB_VISIBILITY_TIMEOUT
+        redis.zadd(DEADLINES_KEY, {job_id: deadline for job_id in job_ids}, xx=True)
+
+def ack(redis, job_id):
+    get_script(redis, ACK_SCRIPT)(
+        keys=[PROCESSING_KEY, DEADLINES_KEY, DATA_KEY, ATTEMPTS_KEY, USERS_KEY],
+        args=[USER_PREFIX, job_id],
+        client=redis
+    )
+
+def fail(redis, job_id):
+    """Count a failed attempt and retry the job, or dead-letter it.
+
+    Returns True when the job was dead-lettered.
+    """
+    return bool(get_script(redis, RETRY_SCRIPT)(
+        keys=[PROCESSING_KEY, DEADLINES_KEY, ATTEMPTS_KEY, PENDING_KEY, DEAD_KEY, USERS_KEY],
+        args=[USER_PREFIX, JOB_MAX_ATTEMPTS, job_id],
+        client=redis
+    ))
+
+def release(redis, job_id):
+    """Put a job back at the head of the queue without counting an attempt,
+    for a worker that is shutting down before it could finish."""
+    pipe = redis.pipeline()
+    pipe.lrem(PROCESSING_KEY, 1, job_id)
+    pipe.zrem(DEADLINES_KEY, job_id)
+    pipe.rpush(PENDING_KEY, job_id)
+    pipe.execute()
+
+def requeue_expired(redis):
+    """Retry jobs whose worker stopped extending their deadline.
+
+    A job claimed by a worker that died before it could set the deadline has
+    no score at all; it gets one now, so it is picked up on a later pass.
+    Returns (requeued ids, dead-lettered ids).
+    """
+    now = time.time()
+    expired = redis.zrangebyscore(DEADLINES_KEY, '-inf', now)
+
+    processing = redis.lrange(PROCESSING_KEY, 0, -1)
+    if processing:
+        scores = redis.zmscore(DEADLINES_KEY, processing)
+        orphans = {job_id: now + JOB_VISIBILITY_TIMEOUT for job_id, score in zip(processing, scores) if score is None}
+        if orphans:
+            redis.zadd(DEADLINES_KEY, orphans, nx=True)
+
+    if not expired:
+        return [], []
+
+    dead = get_script(redis, RETRY_SCRIPT)(
+        keys=[PROCESSING_KEY, DEADLINES_KEY, ATTEMPTS_KEY, PENDING_KEY, DEAD_KEY, USERS_KEY],
+        args=[USER_PREFIX, JOB_MAX_ATTEMPTS, *expired],
+        client=redis
+    )
+
+    return [job_id for job_id in expired if job_id not in dead], dead
+
+def get_payload(redis, job_id):
+    payload = redis.hget(DATA_KEY, job_id)
+    return json.loads(payload) if payload else None
+
+def get_queue_stats():
+    with _stats_lock:
+        stats = dict(queue_stats, backend=STREAM_BACKEND)
+
+    if STREAM_BACKEND == 'queue':
+        redis = get_redis()
+        pipe = redis.pipeline()
+        pipe.llen(PENDING_KEY)
+        pipe.llen(PROCESSING_KEY)
+        pipe.llen(DEAD_KEY)
+        stats['pending'], stats['processing'], stats['dead'] = pipe.execute()
+
+    return stats
@@ -0,0 +1,157 @@
+import os
+import queue
+import threading
+import time
+import traceback
+
+from redis_config import get_pubsub_redis
+
+STREAM_HEARTBEAT_INTERVAL = float(os.getenv('STREAM_HEARTBEAT_INTERVAL', 15))
+STREAM_SUBSCRIBER_QUEUE_SIZE = int(os.getenv('STREAM_SUBSCRIBER_QUEUE_SIZE', 1000))
+
+
+class Subscription:
+    def __init__(self, multiplexer, channel):
+        self.multiplexer = multiplexer
+        self.channel = channel
+        self.queue = queue.Queue(maxsize=STREAM_SUBSCRIBER_QUEUE_SIZE)
+        self.dropped = 0
+
+    def get(self, timeout=None):
+        """Next message data for this channel, or None if timeout passes first"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.multiplexer.unsubscribe(self)
+
+
+class PubSubMultiplexer:
+    """One Redis pub/sub connection per worker process shared by every SSE
+    subscriber in it.
+
+    A single dispatcher thread reads the connection and copies each message
+    into the in-memory queue of every subscription on that channel. The
+    channel is subscribed on Redis when its first local subscriber arrives
+    and unsubscribed when the last one leaves.
+    """
+
+    def __init__(self, redis_client):
+        self.redis_client = redis_client
+        self._pubsub = None
+        self._subscribers = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._needs_resubscribe = False
+        self.stats = {
+            'dispatched': 0,
+            'dropped': 0,
+            'subscribed_total': 0,
+            'dispatcher_errors': 0,
+        }
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='pubsub-dispatcher', daemon=True)
+            self._thread.start()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+
+        with self._lock:
+            subscribers = self._subscribers.setdefault(channel, [])
+            subscribers.append(subscription)
+            self.stats['subscribed_total'] += 1
+
+            if len(subscribers) == 1:
+                if self._pubsub is None:
+                    self._pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+                try:
+                    self._pubsub.subscribe(channel)
+                except Exception:
+                    # The dispatcher reconnects and resubscribes every live channel
+                    self._needs_resubscribe = True
+
+            self._ensure_started()
+
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._subscribers.get(subscription.channel)
+
+            if not subscribers or subscription not in subscribers:
+                return
+
+            subscribers.remove(subscription)
+
+            if not subscribers:
+                del self._subscribers[subscription.channel]
+                try:
+                    self._pubsub.unsubscribe(subscription.channel)
+                except Exception:
+                    pass
+
+    def _run(self):
+        while True:
+            if self._needs_resubscribe:
+                time.sleep(1.0)
+                self._reconnect()
+                continue
+
+            try:
+                message = self._pubsub.get_message(timeout=1.0)
+            except Exception:
+                self.stats['dispatcher_errors'] += 1
+                traceback.print_exc()
+                self._reconnect()
+                continue
+
+            if message is None or message['type'] != 'message':
+                continue
+
+            channel = message['channel']
+            with self._lock:
+                subscribers = list(self._subscribers.get(channel, ()))
+
+            for subscription in subscribers:
+                try:
+                    subscription.queue.put_nowait(message['data'])
+                    self.stats['dispatched'] += 1
+                except queue.Full:
+                    subscription.dropped += 1
+                    self.stats['dropped'] += 1
+
+    def _reconnect(self):
+        # Start over on a fresh connection and resubscribe every live channel
+        with self._lock:
+            try:
+                self._pubsub.close()
+            except Exception:
+                pass
+
+            self._pubsub = self.redis_client.pubsub(ignore_subscribe_messages=True)
+            self._needs_resubscribe = False
+
+            channels = list(self._subscribers)
+            if channels:
+                try:
+                    self._pubsub.subscribe(*channels)
+                except Exception:
+                    self._needs_resubscribe = True
+
+    def get_stats(self):
+        with self._lock:
+            return dict(
+                self.stats,
+                channels=len(self._subscribers),
+                subscribers=sum(len(subscribers) for subscribers in self._subscribers.values())
+            )
+
+
+multiplexer = PubSubMultiplexer(get_pubsub_redis())
+
+def get_multiplexer():
+    return multiplexer
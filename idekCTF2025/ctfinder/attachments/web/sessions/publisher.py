@@ -0,0 +1,139 @@
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+import traceback
+
+from sessions.transport import publish_event
+
+STREAM_COALESCE_MS = float(os.getenv('STREAM_COALESCE_MS', 25))
+STREAM_COALESCE_BYTES = int(os.getenv('STREAM_COALESCE_BYTES', 512))
+
+_stats_lock = threading.Lock()
+publisher_stats = {
+    'deltas': 0,
+    'publishes': 0,
+    'latency_total': 0.0,
+    'latency_max': 0.0,
+}
+
+
+class WindowFlusher:
+    """One daemon thread for every publisher in the process: it flushes a
+    buffer whose window ran out while the upstream had nothing more to say,
+    e.g. between content blocks, so no delta waits longer than the window.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._deadlines = []
+        self._order = itertools.count()
+        self._thread = None
+
+    def schedule(self, publisher, deadline):
+        with self._cond:
+            heapq.heappush(self._deadlines, (deadline, next(self._order), publisher))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='publisher-flush', daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._deadlines:
+                    self._cond.wait()
+
+                deadline, _, publisher = self._deadlines[0]
+                remaining = deadline - time.monotonic()
+                if remaining > 0:
+                    self._cond.wait(remaining)
+                    continue
+                heapq.heappop(self._deadlines)
+
+            try:
+                publisher.flush_expired()
+            except Exception:
+                traceback.print_exc()
+
+window_flusher = WindowFlusher()
+
+
+class CoalescingPublisher:
+    """Buffers content deltas and publishes them as one chunk event once the
+    oldest buffered delta is window_ms old or the buffer reaches max_bytes.
+
+    The window is checked when the next delta arrives and, for a stalled
+    upstream, by window_flusher once it runs out. A window of 0 publishes
+    every delta as it comes in.
+    """
+
+    def __init__(self, redis, channel, message_id, window_ms=STREAM_COALESCE_MS, max_bytes=STREAM_COALESCE_BYTES):
+        self.redis = redis
+        self.channel = channel
+        self.message_id = message_id
+        self.window = window_ms / 1000
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._size = 0
+        self._first_at = None
+
+    def add(self, content):
+        with _stats_lock:
+            publisher_stats['deltas'] += 1
+
+        with self._lock:
+            if not self._buffer:
+                self._first_at = time.monotonic()
+                if self.window > 0:
+                    window_flusher.schedule(self, self._first_at + self.window)
+
+            self._buffer.append(content)
+            self._size += len(content)
+
+            if self._size >= self.max_bytes or time.monotonic() - self._first_at >= self.window:
+                self._flush()
+
+    def flush_expired(self):
+        # the buffer may have been flushed and refilled since this deadline
+        # was scheduled; a newer buffer has a deadline of its own
+        with self._lock:
+            if self._buffer and time.monotonic() - self._first_at >= self.window:
+                self._flush()
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+
+        content = ''.join(self._buffer)
+        latency = time.monotonic() - self._first_at
+        self._buffer = []
+        self._size = 0
+
+        publish_event(self.redis, self.channel, json.dumps({
+            "event": "chunk",
+            "message_id": self.message_id,
+            "content": content
+        }))
+
+        with _stats_lock:
+            publisher_stats['publishes'] += 1
+            publisher_stats['latency_total'] += latency
+            publisher_stats['latency_max'] = max(publisher_stats['latency_max'], latency)
+
+def get_publisher_stats():
+    with _stats_lock:
+        stats = dict(publisher_stats)
+
+    stats['publishes_saved'] = stats['deltas'] - stats['publishes']
+    stats['latency_avg'] = stats['latency_total'] / stats['publishes'] if stats['publishes'] else 0.0
+    stats['window_ms'] = STREAM_COALESCE_MS
+    stats['max_bytes'] = STREAM_COALESCE_BYTES
+    return stats
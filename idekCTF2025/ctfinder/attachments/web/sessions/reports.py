@@ -0,0 +1,140 @@
+import os
+import threading
+import time
+import traceback
+import uuid
+
+import requests
+
+from redis_config import get_redis
+from sessions.versions import bump_session_version
+from sessions.workers import StreamExecutor
+
+BOT_URL = os.getenv('BOT_URL', 'http://bot:5010/')
+# each visit is a headless browser on the bot, so only a few at a time
+REPORT_WORKERS = int(os.getenv('REPORT_WORKERS', 2))
+REPORT_QUEUE_SIZE = int(os.getenv('REPORT_QUEUE_SIZE', 16))
+REPORT_MAX_PER_USER = int(os.getenv('REPORT_MAX_PER_USER', 1))
+REPORT_CONNECT_TIMEOUT = float(os.getenv('REPORT_CONNECT_TIMEOUT', 5))
+REPORT_VISIT_TIMEOUT = float(os.getenv('REPORT_VISIT_TIMEOUT', 30))
+# how long a session stays locked to one dispatch if its worker never
+# clears the lock, e.g. because the process was killed mid-visit
+REPORT_PENDING_TTL = int(os.getenv('REPORT_PENDING_TTL', 300))
+REPORT_STATUS_TTL = int(os.getenv('REPORT_STATUS_TTL', 3600))
+
+_stats_lock = threading.Lock()
+report_stats = {
+    'dispatched': 0,
+    'deduplicated': 0,
+    'sent': 0,
+    'failed': 0,
+    'timeouts': 0,
+}
+
+report_executor = StreamExecutor(
+    max_workers=REPORT_WORKERS,
+    max_queue=REPORT_QUEUE_SIZE,
+    max_per_user=REPORT_MAX_PER_USER
+)
+
+bot_session = requests.Session()
+
+def get_report_executor():
+    return report_executor
+
+def job_key(job_id):
+    return f'report:job:{job_id}'
+
+def pending_key(session_id, user_id):
+    return f'session:{session_id}:{user_id}:report:job'
+
+def _count(name):
+    with _stats_lock:
+        report_stats[name] += 1
+
+def set_status(redis, job_id, status, **fields):
+    pipe = redis.pipeline()
+    pipe.hset(job_key(job_id), mapping={'status': status, **fields})
+    pipe.expire(job_key(job_id), REPORT_STATUS_TTL)
+    pipe.execute()
+
+def dispatch_report(session_id, user_id):
+    """Queue a bot visit for the session and return its job id.
+
+    A session has at most one dispatch in flight; asking again while it is
+    queued or running returns the same job. Raises StreamQueueFull or
+    UserLimitReached from the executor when it cannot take the job.
+    """
+    redis = get_redis()
+    job_id = str(uuid.uuid4())
+
+    if not redis.set(pending_key(session_id, user_id), job_id, nx=True, ex=REPORT_PENDING_TTL):
+        existing = redis.get(pending_key(session_id, user_id))
+        if existing:
+            _count('deduplicated')
+            return existing
+        redis.set(pending_key(session_id, user_id), job_id, ex=REPORT_PENDING_TTL)
+
+    set_status(redis, job_id, 'queued', session_id=session_id, user_id=user_id, created_at=time.time())
+
+    try:
+        report_executor.submit(user_id, visit, job_id, session_id, user_id)
+    except Exception:
+        redis.delete(pending_key(session_id, user_id), job_key(job_id))
+        raise
+
+    _count('dispatched')
+    return job_id
+
+def request_visit(session_id, user_id):
+    """Ask the bot to visit the session; returns (sent, error)"""
+    try:
+        response = bot_session.get(
+            BOT_URL,
+            params={'session_id': session_id, 'user_id': user_id},
+            timeout=(REPORT_CONNECT_TIMEOUT, REPORT_VISIT_TIMEOUT)
+        )
+        sent = response.json().get('message') == "Bot visited the URL"
+        return sent, None if sent else 'Failed to get report'
+    except requests.Timeout:
+        # the bot has no way to cancel a visit; stop waiting for it so the
+        # slot goes to the next report
+        _count('timeouts')
+        return False, 'Bot visit timed out'
+    except (requests.RequestException, ValueError):
+        return False, 'Failed to get report'
+
+def visit(job_id, session_id, user_id):
+    redis = get_redis()
+
+    try:
+        try:
+            set_status(redis, job_id, 'running', started_at=time.time())
+            sent, error = request_visit(session_id, user_id)
+
+            if sent:
+                redis.delete(f"session:{session_id}:{user_id}:report")
+                bump_session_version(redis, session_id)
+                set_status(redis, job_id, 'sent', finished_at=time.time())
+                _count('sent')
+                return
+        except Exception:
+            # a Redis error around the visit must not leave the job 'running'
+            traceback.print_exc()
+            error = 'Failed to get report'
+
+        _count('failed')
+        set_status(redis, job_id, 'failed', error=error, finished_at=time.time())
+    finally:
+        if redis.get(pending_key(session_id, user_id)) == job_id:
+            redis.delete(pending_key(session_id, user_id))
+
+def get_report_job(job_id):
+    return get_redis().hgetall(job_key(job_id)) or None
+
+def get_report_stats():
+    with _stats_lock:
+        stats = dict(report_stats)
+
+    stats['executor'] = report_executor.get_stats()
+    return stats
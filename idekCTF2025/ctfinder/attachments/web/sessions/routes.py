@@ -1,19 +1,28 @@
-from flask import Blueprint, request, jsonify, session as flask_session, g, render_template, Response, current_app, redirect, url_for
+from flask import Blueprint, request, jsonify, session as flask_session, g, render_template, Response, current_app, redirect, url_for, make_response
 import json
+import re
 from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 import uuid
 import time
-import threading
-import requests
 from decorators import login_required, token_required
 from database import get_db
 from sessions.sanitizer import Sanitizer
 from redis_config import get_redis, get_pubsub_redis
 from sessions.stream import stream_claude_response
+from sessions.transport import is_resumable, read_events, StreamGone
+from sessions.multiplexer import get_multiplexer, STREAM_HEARTBEAT_INTERVAL
+from sessions.workers import get_stream_executor, StreamQueueFull, UserLimitReached, STREAM_RETRY_AFTER
+from sessions.history import drop_history
+from ratelimit import admit, refund
+from sessions.jobs import STREAM_BACKEND, enqueue_turn
+from sessions.reports import dispatch_report, get_report_job
+from sessions.versions import get_session_version, bump_session_version, make_etag, is_not_modified, not_modified, render_cache
 
 session_bp = Blueprint('sessions', __name__, url_prefix='/sessions')
 
+STREAM_ENTRY_ID = re.compile(r'^\d+(-\d+)?$')
+
 @session_bp.route('/', methods=['GET'], strict_slashes=False)
 @login_required
 def get_sessions():
@@ -43,16 +52,52 @@ def session_page(session_id):
     username = flask_session['username']
     is_admin = flask_session['is_admin']
 
-    error_message = None
     report_id = None
 
-    messages_json = []
-
     if is_admin:
         user_id = request.args.get('user_id', type=str)
         report_id = request.args.get('report_id', type=str)
 
     redis = get_redis()
+    version = get_session_version(redis, session_id)
+    etag = make_etag(version, session_id, user_id, flask_session['user_id'], username, is_admin, report_id)
+
+    if is_not_modified(etag):
+        return not_modified(etag, weak=True)
+
+    page_data = render_cache.get((session_id, user_id, version))
+
+    if page_data is None:
+        page_data = load_session_page(redis, session_id, user_id)
+
+        if page_data is None:
+            return redirect(url_for('index'))
+
+        render_cache.set((session_id, user_id, version), page_data)
+
+    session_json, messages_json = page_data
+
+    user_json = {
+        'username': username,
+        'user_id': user_id,
+        'is_admin': is_admin
+    }
+    
+    response = make_response(render_template('session.html', 
+                         session_data=session_json, 
+                         messages_data=messages_json,
+                         user_data=user_json,
+                         report_id=report_id if report_id else None))
+
+    # weak: the markup carries a fresh CSP nonce on every render
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def load_session_page(redis, session_id, user_id):
+    error_message = None
+    messages_json = []
+
     report = redis.get(f"session:{session_id}:{user_id}:report")
 
     if report:
@@ -65,7 +110,7 @@ def session_page(session_id):
     ).fetchone()
     
     if not session_data:
-        return redirect(url_for('index'))
+        return None
     
     messages = db.execute(
         'SELECT id, role, content, token_count, parent_id, sequence_id FROM messages WHERE session_id = ? ORDER BY sequence_id DESC LIMIT 10',
@@ -107,18 +152,8 @@ def session_page(session_id):
             'sequence_id': message['sequence_id']
         } for message in messages
     ])
-    
-    user_json = {
-        'username': username,
-        'user_id': user_id,
-        'is_admin': is_admin
-    }
-    
-    return render_template('session.html', 
-                         session_data=session_json, 
-                         messages_data=messages_json,
-                         user_data=user_json,
-                         report_id=report_id if report_id else None)
+
+    return session_json, messages_json
 
 @session_bp.route('/<session_id>/messages', methods=['GET'])
 @login_required
@@ -131,6 +166,12 @@ def get_messages(session_id):
     reverse = request.args.get('reverse', 'false').lower() == 'true'
     
     limit = min(max(limit, 1), 50)
+
+    version = get_session_version(get_redis(), session_id)
+    etag = make_etag(version, session_id, last_sequence_id, limit, reverse)
+
+    if is_not_modified(etag):
+        return not_modified(etag)
     
     db = get_db()
     
@@ -157,7 +198,7 @@ def get_messages(session_id):
             (session_id, last_sequence_id, limit)
         ).fetchall()
     
-    return jsonify({
+    response = jsonify({
         'messages': [
             {
                 'id': message['id'], 
@@ -168,7 +209,11 @@ def get_messages(session_id):
                 'sequence_id': message['sequence_id']
             } for message in messages
         ],
-    }), 200
+    })
+
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response, 200
 
 @session_bp.route('/<session_id>/stream', methods=['GET'])
 @login_required
@@ -184,53 +229,101 @@ def message_stream(session_id):
     channel_parts = channel.split(':')
     if len(channel_parts) < 5 or channel_parts[1] != session_id or channel_parts[2] != user_id:
         return jsonify({'error': 'Unauthorized'}), 403
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id', type=str)
+
+    if not last_event_id or not STREAM_ENTRY_ID.match(last_event_id):
+        last_event_id = '0'
+
+    def replay_stream():
+        redis_client = get_pubsub_redis()
+
+        try:
+            yield f"data: {json.dumps({'event': 'connected', 'resumable': True})}\n\n"
+
+            for event_id, data in read_events(redis_client, channel, last_event_id, block_ms=int(STREAM_HEARTBEAT_INTERVAL * 1000)):
+                if event_id is None:
+                    # writing is the only way a WSGI generator learns that
+                    # its client went away
+                    yield f"data: {json.dumps({'event': 'heartbeat'})}\n\n"
+                    continue
+
+                try:
+                    json_data = json.loads(data)
+                except json.JSONDecodeError:
+                    continue
+
+                if json_data.get('event') == 'error':
+                    yield f"event: error\nid: {event_id}\ndata: {data}\n\n"
+                    break
+
+                yield f"id: {event_id}\ndata: {data}\n\n"
+
+                if json_data.get('event') == 'complete':
+                    break
+
+        except StreamGone:
+            error_data = json.dumps({
+                'event': 'error',
+                'message': 'Stream ended without a reply'
+            })
+            yield f"event: error\ndata: {error_data}\n\n"
+        except Exception as e:
+            error_data = json.dumps({
+                'event': 'error', 
+                'message': f'Stream connection error: {str(e)}'
+            })
+            yield f"data: {error_data}\n\n"
     
     def event_stream():
-        redis_client = get_pubsub_redis()
-        pubsub = redis_client.pubsub()
+        subscription = get_multiplexer().subscribe(channel)
         
         try:
-            pubsub.subscribe(channel)
-            
             yield f"data: {json.dumps({'event': 'connected'})}\n\n"
 
+            last_sent = time.monotonic()
+
             while True:
                 try:
-                    message = pubsub.get_message(timeout=1.0)
+                    raw_data = subscription.get(timeout=1.0)
                     
-                    if message is None:
+                    if raw_data is None:
+                        # Heartbeats keep proxies from closing an idle stream and
+                        # surface disconnected clients so their slot is freed
+                        if time.monotonic() - last_sent >= STREAM_HEARTBEAT_INTERVAL:
+                            yield f"data: {json.dumps({'event': 'heartbeat'})}\n\n"
+                            last_sent = time.monotonic()
                         continue
 
-                    if message['type'] == 'message':
+                    last_sent = time.monotonic()
+
+                    try:
+                        if isinstance(raw_data, bytes):
+                            data = raw_data.decode('utf-8')
+                        else:
+                            data = str(raw_data)
+
                         try:
-                            raw_data = message['data']
-
-                            if isinstance(raw_data, bytes):
-                                data = raw_data.decode('utf-8')
-                            else:
-                                data = str(raw_data)
-
-                            try:
-                                json_data = json.loads(data)
-                                
-                                if json_data.get('event') == 'error':
-                                    yield f"event: error\ndata: {data}\n\n"
-                                    break
-                                elif json_data.get('event') == 'complete':
-                                    yield f"data: {data}\n\n"
-                                    break
-                            except json.JSONDecodeError:
-                                continue
-            
-                            yield f"data: {data}\n\n"
+                            json_data = json.loads(data)
                             
-                        except Exception as e:
-                            error_data = json.dumps({
-                                'event': 'error', 
-                                'message': f'Stream processing error'
-                            })
-                            yield f"data: {error_data}\n\n"
-                            break
+                            if json_data.get('event') == 'error':
+                                yield f"event: error\ndata: {data}\n\n"
+                                break
+                            elif json_data.get('event') == 'complete':
+                                yield f"data: {data}\n\n"
+                                break
+                        except json.JSONDecodeError:
+                            continue
+        
+                        yield f"data: {data}\n\n"
+                        
+                    except Exception as e:
+                        error_data = json.dumps({
+                            'event': 'error', 
+                            'message': f'Stream processing error'
+                        })
+                        yield f"data: {error_data}\n\n"
+                        break
                             
                 except Exception as e:
                     error_data = json.dumps({
@@ -247,14 +340,10 @@ def message_stream(session_id):
             })
             yield f"data: {error_data}\n\n"
         finally:
-            try:
-                pubsub.unsubscribe(channel)
-                pubsub.close()
-            except:
-                pass
+            subscription.close()
     
     return Response(
-        event_stream(), 
+        replay_stream() if is_resumable() else event_stream(), 
         mimetype='text/event-stream', 
         headers={ 
             'Cache-Control': 'no-cache', 
@@ -278,14 +367,35 @@ def get_report(session_id):
     if not report:
         return jsonify({'error': 'No report found'}), 404
 
-    res = requests.get(f"http://bot:5010/?session_id={session_id}&user_id={user_id}")
+    try:
+        job_id = dispatch_report(session_id, user_id)
+    except UserLimitReached:
+        return jsonify({'error': 'a report is already in progress'}), 429, {'Retry-After': str(STREAM_RETRY_AFTER)}
+    except StreamQueueFull:
+        return jsonify({'error': 'server busy, try again later'}), 503, {'Retry-After': str(STREAM_RETRY_AFTER)}
 
-    if res.json().get('message') != "Bot visited the URL":
-        return jsonify({'error': 'Failed to get report'}), 400
-    
-    redis.delete(f"session:{session_id}:{user_id}:report")
+    return jsonify({
+        'message': 'Report queued',
+        'job_id': job_id,
+        'status_url': url_for('sessions.get_report_status', session_id=session_id, job_id=job_id)
+    }), 202
+
+@session_bp.route('/<session_id>/report/jobs/<job_id>', methods=['GET'])
+@login_required
+@token_required
+def get_report_status(session_id, job_id):
+    user_id = flask_session['user_id']
+
+    job = get_report_job(job_id)
+
+    if not job or job.get('user_id') != user_id or job.get('session_id') != session_id:
+        return jsonify({'error': 'No report found'}), 404
 
-    return jsonify({'message': 'Report sent'}), 200
+    return jsonify({
+        'job_id': job_id,
+        'status': job['status'],
+        'error': job.get('error')
+    }), 200
 
 @session_bp.route('/', methods=['POST'], strict_slashes=False)
 @login_required
@@ -340,6 +450,10 @@ def create_message(session_id):
     if redis.get(f"session:{session_id}:{user_id}:report"):
         return jsonify({'error': 'Report is not finished yet'}), 400
 
+    admitted, retry_after = admit(user_id)
+    if not admitted:
+        return jsonify({'error': 'rate limit exceeded'}), 429, {'Retry-After': str(retry_after)}
+
     content = data.get('content')
 
     sanitizer = Sanitizer(content)
@@ -365,6 +479,7 @@ def create_message(session_id):
             (content[:20], session_id)
         )
         db.commit()
+        bump_session_version(redis, session_id)
 
     redis = get_redis()
     redis.set(meta_cache_key, json.dumps({
@@ -376,13 +491,24 @@ def create_message(session_id):
         'timestamp': timestamp
     }), ex = 60 * 5)
 
-    thread = threading.Thread(
-        target=stream_claude_response,
-        args=(current_app._get_current_object(), session_id, user_id, content, message_id, stream_channel)
-    )
-
-    thread.daemon = True
-    thread.start()
+    try:
+        if STREAM_BACKEND == 'queue':
+            enqueue_turn(session_id, user_id, content, message_id, stream_channel, redis)
+        else:
+            get_stream_executor().submit(
+                user_id,
+                stream_claude_response,
+                current_app._get_current_object(), session_id, user_id, content, message_id, stream_channel
+            )
+    except UserLimitReached:
+        # turned away before any work was done, so it costs no rate limit
+        redis.delete(meta_cache_key)
+        refund(user_id)
+        return jsonify({'error': 'too many messages in progress'}), 429, {'Retry-After': str(STREAM_RETRY_AFTER)}
+    except StreamQueueFull:
+        redis.delete(meta_cache_key)
+        refund(user_id)
+        return jsonify({'error': 'server busy, try again later'}), 503, {'Retry-After': str(STREAM_RETRY_AFTER)}
     
     return jsonify({
         'message_id': message_id,
@@ -404,4 +530,8 @@ def delete_session(session_id):
     )
     db.commit()
 
+    redis = get_redis()
+    drop_history(redis, session_id, user_id)
+    bump_session_version(redis, session_id)
+
     return jsonify({'message': 'session deleted'}), 200
\ No newline at end of file
@@ -1,44 +1,171 @@
 import time
-import bleach
 import hashlib
+import os
+import re
+import threading
 
-sanitize_store = {}
+from bleach.sanitizer import Cleaner
+
+from cache import TTLCache
+from redis_config import get_redis
+
+SANITIZE_CACHE_SIZE = int(os.getenv('SANITIZE_CACHE_SIZE', 10000))
+SANITIZE_CACHE_TTL = int(os.getenv('SANITIZE_CACHE_TTL', 60))
+SANITIZE_CACHE_REDIS = os.getenv('SANITIZE_CACHE_REDIS', '0') == '1'
+
+BAD_CHARS = ['<', '>', '=', '!', '@', '#', '$', '%', '^', '&', '*', '(', ')', '[', ']', '{', '}', '|', '\\', '/', '?', ':', ';', '.', ',', '\'', '\"', '`', '~']
+
+# one character class over all of BAD_CHARS: a single pass over the content,
+# and the cheapest check while the content is short
+BAD_CHARS_RE = re.compile('[' + re.escape(''.join(BAD_CHARS)) + ']')
+
+# Past SHORT_CONTENT characters one regex pass costs more than a vectorised
+# str.__contains__ per character, so long content is checked per character,
+# in order of how often the character turns up. '<' is checked before
+# anything else at every length: markup is what check() is there to catch.
+PROSE_CHARS = ['>', '.', ',', '\'', ':', '(', ')', '"', '?', '!', '/']
+BAD_CHARS_BY_FREQUENCY = PROSE_CHARS + [char for char in BAD_CHARS if char not in PROSE_CHARS and char != '<']
+SHORT_CONTENT = int(os.getenv('SANITIZE_SHORT_CONTENT', 96))
+
+ALLOWED_TAGS = ['p', 'strong', 'ul', 'ol', 'li', 'h1', 'h2', 'h3', 'h4', 'code']
+ALLOWED_ATTRS = {
+    '*': ['class']
+}
+
+SANITIZE_CHUNK_SIZE = int(os.getenv('SANITIZE_CHUNK_SIZE', 2048))
+
+sanitize_store = TTLCache(SANITIZE_CACHE_SIZE, SANITIZE_CACHE_TTL)
+
+shared_stats = {
+    'hits': 0,
+    'misses': 0,
+    'errors': 0,
+}
 
 class Sanitizer:
     def __init__(self, content: str):
         self.content = content
 
     def generate_key(self, session_id, user_id):
-        global sanitize_store
         nonce = self.content[:128]
         timestamp = int(time.time())
         key = f"{session_id}:{user_id}:{nonce}:{timestamp}"
         hash = hashlib.sha256(key.encode()).hexdigest()
 
         return hash
-    
+
     def check(self, session_id, user_id):
-        global sanitize_store
-        
         hash = self.generate_key(session_id, user_id)
-        
-        if hash in sanitize_store:
-            return sanitize_store[hash]
-    
-        bad_chars = ['<', '>', '=', '!', '@', '#', '$', '%', '^', '&', '*', '(', ')', '[', ']', '{', '}', '|', '\\', '/', '?', ':', ';', '.', ',', '\'', '\"', '`', '~']
-
-        for char in bad_chars:
-            if char in self.content:
-                sanitize_store[hash] = True
-                return True
-        
-        sanitize_store[hash] = False
-        return False
-    
+
+        cached = sanitize_store.get(hash)
+        if cached is not None:
+            return cached
+
+        if SANITIZE_CACHE_REDIS:
+            cached = get_shared_verdict(hash)
+            if cached is not None:
+                sanitize_store.set(hash, cached)
+                return cached
+
+        verdict = contains_bad_chars(self.content)
+
+        sanitize_store.set(hash, verdict)
+        if SANITIZE_CACHE_REDIS:
+            set_shared_verdict(hash, verdict)
+
+        return verdict
+
     def sanitize(self):
-        allowed_tags = ['p', 'strong', 'ul', 'ol', 'li', 'h1', 'h2', 'h3', 'h4', 'code']
-        allowed_attrs = {
-            '*': ['class']
-        }
+        return get_cleaner().clean(self.content)
+
+class StreamingSanitizer:
+    """Sanitizes a reply piece by piece while it is still streaming.
+
+    feed() buffers deltas and, once SANITIZE_CHUNK_SIZE characters are
+    pending, cleans everything up to the last newline. A segment cut there
+    cannot end inside a tag or an entity, so cleaning the segments one by one
+    gives the same text as cleaning the whole reply. Once a '<' shows up the
+    rest of the reply is held back and cleaned in one piece by close(), which
+    returns the sanitized reply.
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._pending_size = 0
+        self._parts = []
+        self._whole = False
+
+    def feed(self, text):
+        self._pending.append(text)
+        self._pending_size += len(text)
+
+        if self._whole or self._pending_size < SANITIZE_CHUNK_SIZE or '\n' not in text:
+            return
+
+        buffer = ''.join(self._pending)
+        if '<' in buffer:
+            self._whole = True
+            return
+
+        cut = buffer.rfind('\n') + 1
+        self._parts.append(get_cleaner().clean(buffer[:cut]))
+        self._pending = [buffer[cut:]]
+        self._pending_size = len(buffer) - cut
+
+    def close(self):
+        buffer = ''.join(self._pending)
+        if buffer:
+            self._parts.append(get_cleaner().clean(buffer))
+
+        self._pending = []
+        self._pending_size = 0
+        return ''.join(self._parts)
+
+# Cleaner keeps html5lib parser state between calls and is not thread-safe, so
+# each stream worker builds one on first use and reuses it for every reply
+_local = threading.local()
+
+def get_cleaner():
+    cleaner = getattr(_local, 'cleaner', None)
+    if cleaner is None:
+        cleaner = _local.cleaner = Cleaner(tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRS)
+    return cleaner
+
+def contains_bad_chars(content):
+    if '<' in content:
+        return True
+
+    if len(content) < SHORT_CONTENT:
+        return BAD_CHARS_RE.search(content) is not None
+
+    for char in BAD_CHARS_BY_FREQUENCY:
+        if char in content:
+            return True
+
+    return False
+
+def get_shared_verdict(hash):
+    try:
+        value = get_redis().get(f"sanitize:{hash}")
+    except Exception:
+        shared_stats['errors'] += 1
+        return None
+
+    if value is None:
+        shared_stats['misses'] += 1
+        return None
+
+    shared_stats['hits'] += 1
+    return value == '1'
+
+def set_shared_verdict(hash, verdict):
+    try:
+        get_redis().set(f"sanitize:{hash}", '1' if verdict else '0', ex=SANITIZE_CACHE_TTL)
+    except Exception:
+        shared_stats['errors'] += 1
 
-        return bleach.clean(self.content, tags=allowed_tags, attributes=allowed_attrs)
\ No newline at end of file
+def get_sanitizer_cache_stats():
+    return {
+        'local': sanitize_store.get_stats(),
+        'shared': dict(shared_stats, enabled=SANITIZE_CACHE_REDIS)
+    }
@@ -0,0 +1,87 @@
+import json
+
+DELTA_PREFIX = b'event: content_block_delta\ndata: '
+
+_decoder = json.JSONDecoder()
+
+
+class SSEParser:
+    """Incremental parser for a text/event-stream body.
+
+    feed() takes raw bytes exactly as they come off the socket, in chunks of
+    any size, and returns the (event, data) pairs completed by that chunk.
+    Events are split on the blank line between them with bytes.split, and
+    the content_block_delta frames that make up almost all of a reply are
+    recognised by prefix without walking their lines. data stays bytes so
+    callers only decode the events they care about, with load_data(). event
+    is None when the server sent no event: field.
+    """
+
+    def __init__(self):
+        self._buffer = b''
+
+    def feed(self, chunk):
+        buffer = self._buffer + chunk
+        if b'\r' in chunk or self._buffer.endswith(b'\r'):
+            buffer = buffer.replace(b'\r\n', b'\n')
+
+        # a chunk can end between the \r and \n of a CRLF; hold the \r back
+        # so it is not read as a line ending of its own
+        pending = b''
+        if buffer.endswith(b'\r'):
+            buffer, pending = buffer[:-1], b'\r'
+
+        end = buffer.rfind(b'\n\n')
+        if end == -1:
+            self._buffer = buffer + pending
+            return []
+
+        self._buffer = buffer[end + 2:] + pending
+        events = []
+
+        for block in buffer[:end].split(b'\n\n'):
+            if block.startswith(DELTA_PREFIX) and b'\n' not in block[len(DELTA_PREFIX):]:
+                events.append(('content_block_delta', block[len(DELTA_PREFIX):]))
+                continue
+
+            event = parse_block(block)
+            if event is not None:
+                events.append(event)
+
+        return events
+
+def parse_block(block):
+    event = None
+    data = []
+
+    for line in block.split(b'\n'):
+        if line.startswith(b'data:'):
+            data.append(line[6:] if line[5:6] == b' ' else line[5:])
+        elif line.startswith(b'event:'):
+            event = (line[7:] if line[6:7] == b' ' else line[6:]).decode()
+        # id:, retry: and : comments carry nothing the stream worker uses
+
+    if not data:
+        return None
+
+    return event, b'\n'.join(data)
+
+def load_data(data):
+    """json.loads for an event payload.
+
+    json.loads on bytes sniffs the encoding first, and on str it runs an extra
+    whitespace match after the document; upstream payloads are compact UTF-8
+    JSON, so decode once and go straight to raw_decode.
+    """
+    try:
+        return _decoder.raw_decode(data.decode())[0]
+    except ValueError:
+        return json.loads(data)
+
+def iter_sse_events(response, chunk_size=None):
+    """Yield (event, data) pairs from a streaming requests response"""
+    parser = SSEParser()
+
+    for chunk in response.iter_content(chunk_size=chunk_size):
+        if chunk:
+            yield from parser.feed(chunk)
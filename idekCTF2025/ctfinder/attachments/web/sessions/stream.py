@@ -1,14 +1,77 @@
-import requests
 import json
 import uuid
 import sqlite3
 import html
+import time
+
+import requests
 
 from redis_config import get_redis
+from upstream import post_messages
 from database import get_db
 from tokens.utils import get_token_by_user_id
-from sessions.utils import get_conversation_history, save_message_to_db
-from sessions.sanitizer import Sanitizer
+from sessions.utils import get_conversation_history, save_messages_to_db
+from sessions.sanitizer import Sanitizer, StreamingSanitizer
+from sessions.publisher import CoalescingPublisher
+from sessions.transport import publish_event, close_channel
+from sessions.sse import iter_sse_events, load_data
+from sessions.versions import bump_session_version
+from sessions.completions import get_cached_completion, store_completion, replay_chunks
+from sessions.hedging import UPSTREAM_HEDGE, hedged_reply, record_ttft
+
+def report_stream_error(redis, session_id, user_id, stream_channel, assistant_message_id, error_message):
+    publish_event(redis, stream_channel, json.dumps({
+        "event": "error",
+        "message": "Error streaming response",
+        "status_code": 500
+    }))
+    
+    redis.set(f"session:{session_id}:{user_id}:report", json.dumps({
+        "event": "error",
+        "meta": json.loads(redis.get(stream_channel.replace('stream', 'meta'))),
+        "message_id": assistant_message_id,
+        "message": error_message
+    }))
+    bump_session_version(redis, session_id)
+
+    redis.delete(stream_channel.replace('stream', 'meta'))
+    close_channel(redis, stream_channel)
+
+def iter_upstream_reply(response):
+    """Turn an upstream event stream into ('delta', text), ('error', message)
+    and ('tokens', output_tokens) pairs; delta text comes out html-escaped.
+    """
+    with response:
+        for event, data in iter_sse_events(response):
+            if event is None:
+                event = load_data(data).get('type')
+
+            if event == 'content_block_delta':
+                content_delta = load_data(data)['delta'].get('text')
+                if content_delta:
+                    yield 'delta', html.escape(content_delta)
+
+            elif event == 'error':
+                error_data = load_data(data)
+                yield 'error', f"Claude API Error: {error_data.get('error', {}).get('message', 'stream error')}"
+                return
+
+            elif event == 'message_delta':
+                usage = load_data(data).get('usage') or {}
+                if usage.get('output_tokens'):
+                    yield 'tokens', usage['output_tokens']
+
+def start_upstream_reply(headers, request_body):
+    response = post_messages(headers, request_body)
+    return response, iter_upstream_reply(response)
+
+def iter_cached_reply(cached):
+    content, token_count = cached
+
+    for chunk in replay_chunks(content):
+        yield 'delta', chunk
+
+    yield 'tokens', token_count
 
 def stream_claude_response(app, session_id, user_id, content, parent_message_id, stream_channel):
     with app.app_context():
@@ -31,14 +94,23 @@ def stream_claude_response(app, session_id, user_id, content, parent_message_id,
         redis = get_redis()
         assistant_message_id = str(uuid.uuid4())
 
-        response = requests.post(
-            "https://api.anthropic.com/v1/messages",
-            headers=headers,
-            json=request_body,
-            stream=True
-        )
+        cached = get_cached_completion(request_body, api_key)
+
+        started = time.monotonic()
+
+        try:
+            if cached is not None:
+                reply = iter_cached_reply(cached)
+            elif UPSTREAM_HEDGE:
+                response, reply = hedged_reply(lambda: start_upstream_reply(headers, request_body))
+            else:
+                response, reply = start_upstream_reply(headers, request_body)
+        except requests.RequestException as e:
+            # connect retries ran out, or the upstream never answered
+            report_stream_error(redis, session_id, user_id, stream_channel, assistant_message_id, f"Claude API Error: {type(e).__name__}")
+            return
         
-        if not response.ok:
+        if cached is None and not response.ok:
             error_message = f"Claude API Error: HTTP {response.status_code}"
 
             try:
@@ -48,53 +120,60 @@ def stream_claude_response(app, session_id, user_id, content, parent_message_id,
                     error_message += f" - {error_data['error']['message']}"
             except:
                 pass
+            finally:
+                response.close()
 
-            redis.publish(stream_channel, json.dumps({
-                "event": "error",
-                "message": "Error streaming response",
-                "status_code": 500
-            }))
-            
-            redis.set(f"session:{session_id}:{user_id}:report", json.dumps({
-                "event": "error",
-                "meta": json.loads(redis.get(stream_channel.replace('stream', 'meta'))),
-                "message_id": assistant_message_id,
-                "message": error_message
-            }))
-
-            redis.delete(stream_channel.replace('stream', 'meta'))
-            redis.delete(stream_channel)
+            report_stream_error(redis, session_id, user_id, stream_channel, assistant_message_id, error_message)
 
             return
         
-        full_content = ""
+        content_parts = []
         token_count = 0
         
-        redis.publish(stream_channel, json.dumps({
+        publish_event(redis, stream_channel, json.dumps({
             "event": "start",
             "message_id": assistant_message_id,
             "parent_id": parent_message_id
         }))
     
-        for line in response.iter_lines():
-            if line:
-                line_text = line.decode('utf-8')
-                if line_text.startswith('data: '):
-                    line_data = json.loads(line_text[6:])
-                    
-                    if 'type' in line_data and line_data['type'] == 'content_block_delta':
-                        content_delta = line_data['delta']['text']
-                        content_delta = html.escape(content_delta)
-                        full_content += content_delta
-                        token_count += 1
-
-                        redis.publish(stream_channel, json.dumps({
-                            "event": "chunk",
-                            "message_id": assistant_message_id,
-                            "content": content_delta
-                        }))
-
-        redis.publish(stream_channel, json.dumps({
+        publisher = CoalescingPublisher(redis, stream_channel, assistant_message_id)
+        streaming_sanitizer = StreamingSanitizer()
+
+        first_delta = cached is None
+
+        try:
+            for kind, value in reply:
+                if kind == 'delta':
+                    if first_delta:
+                        record_ttft(time.monotonic() - started)
+                        first_delta = False
+
+                    content_parts.append(value)
+                    streaming_sanitizer.feed(value)
+                    token_count += 1
+
+                    publisher.add(value)
+
+                elif kind == 'error':
+                    publisher.flush()
+                    report_stream_error(redis, session_id, user_id, stream_channel, assistant_message_id, value)
+                    return
+
+                elif kind == 'tokens':
+                    token_count = value
+        except requests.RequestException as e:
+            # read timeout or dropped connection part way through the reply
+            publisher.flush()
+            report_stream_error(redis, session_id, user_id, stream_channel, assistant_message_id, f"Claude API Error: {type(e).__name__}")
+            return
+
+        publisher.flush()
+        full_content = ''.join(content_parts)
+
+        if cached is None:
+            store_completion(request_body, api_key, full_content, token_count)
+
+        publish_event(redis, stream_channel, json.dumps({
             "event": "complete",
             "message_id": assistant_message_id,
             "content": full_content
@@ -103,12 +182,14 @@ def stream_claude_response(app, session_id, user_id, content, parent_message_id,
         sanitizer = Sanitizer(full_content)
     
         if sanitizer.check(session_id, user_id):
-            full_content = sanitizer.sanitize()
+            full_content = streaming_sanitizer.close()
 
         meta_data = json.loads(redis.get(stream_channel.replace('stream', 'meta')))
 
-        save_message_to_db(session_id, user_id, parent_message_id, 'user', meta_data['content'], None, 0)
-        save_message_to_db(session_id, user_id, assistant_message_id, 'assistant', full_content, parent_message_id, token_count)
+        save_messages_to_db(session_id, user_id, [
+            (parent_message_id, 'user', meta_data['content'], None, 0),
+            (assistant_message_id, 'assistant', full_content, parent_message_id, token_count)
+        ])
 
         redis.delete(stream_channel.replace('stream', 'meta'))
-        redis.delete(stream_channel)
\ No newline at end of file
+        close_channel(redis, stream_channel)
\ No newline at end of file
@@ -0,0 +1,71 @@
+import os
+import time
+
+# 'pubsub' fans events out over plain Redis pub/sub, so anything published
+# before the browser subscribes is gone. 'streams' appends them to a capped
+# Redis Stream under the channel name instead, which lets /stream replay
+# from the client's Last-Event-ID.
+STREAM_TRANSPORT = os.getenv('STREAM_TRANSPORT', 'pubsub')
+STREAM_MAXLEN = int(os.getenv('STREAM_MAXLEN', 2000))
+STREAM_RETENTION = int(os.getenv('STREAM_RETENTION', 300))
+STREAM_BLOCK_MS = int(os.getenv('STREAM_BLOCK_MS', 1000))
+# a reader gives up on a channel that has had no new entries for this long,
+# e.g. because the turn behind it crashed before publishing complete or error
+STREAM_IDLE_TIMEOUT = float(os.getenv('STREAM_IDLE_TIMEOUT', 300))
+
+
+class StreamGone(Exception):
+    pass
+
+
+def is_resumable():
+    return STREAM_TRANSPORT == 'streams'
+
+def publish_event(redis, channel, data):
+    if STREAM_TRANSPORT == 'streams':
+        redis.xadd(channel, {'data': data}, maxlen=STREAM_MAXLEN, approximate=True)
+    else:
+        redis.publish(channel, data)
+
+def close_channel(redis, channel):
+    if STREAM_TRANSPORT == 'streams':
+        # Keep the log around long enough for a late or reconnecting reader
+        redis.expire(channel, STREAM_RETENTION)
+    else:
+        redis.delete(channel)
+
+def read_events(redis, channel, last_event_id='0', block_ms=STREAM_BLOCK_MS, idle_timeout=STREAM_IDLE_TIMEOUT):
+    """Yield (entry_id, data) from a stream channel, starting after last_event_id.
+
+    A read that comes back empty yields (None, None), so the caller can write
+    a heartbeat and find out whether its client is still there. Raises
+    StreamGone once a channel that existed has expired, or when nothing new
+    has arrived for idle_timeout seconds.
+    """
+    seen = False
+    idle_since = time.monotonic()
+
+    while True:
+        response = redis.xread({channel: last_event_id}, block=block_ms, count=100)
+
+        if not response:
+            # the channel only appears with the turn's first event, so a
+            # missing key is only final once it has been there
+            if redis.exists(channel):
+                seen = True
+            elif seen:
+                raise StreamGone('stream expired')
+
+            if time.monotonic() - idle_since >= idle_timeout:
+                raise StreamGone('stream idle')
+
+            yield None, None
+            continue
+
+        seen = True
+        idle_since = time.monotonic()
+
+        for _, entries in response:
+            for entry_id, fields in entries:
+                last_event_id = entry_id
+                yield entry_id, fields.get('data', '')
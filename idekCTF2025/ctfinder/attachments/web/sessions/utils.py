@@ -1,11 +1,23 @@
 from database import get_db
+from redis_config import get_redis
+from sessions.versions import bump_session_version
+from sessions.history import HISTORY_WINDOW, read_history, append_history, populate_history, pack_history
 
 def get_conversation_history(session_id, user_id):
+    redis = get_redis()
+
+    history = read_history(redis, session_id, user_id)
+    if history is None:
+        history = populate_history(redis, session_id, user_id, lambda: load_conversation_history(session_id, user_id))
+
+    return pack_history(history)
+
+def load_conversation_history(session_id, user_id):
     db = get_db()
 
     cursor = db.execute(
-        'SELECT * FROM messages WHERE session_id = ? AND user_id = ? ORDER BY sequence_id DESC LIMIT 10',
-        (session_id, user_id)
+        'SELECT * FROM messages WHERE session_id = ? AND user_id = ? ORDER BY sequence_id DESC LIMIT ?',
+        (session_id, user_id, HISTORY_WINDOW)
     )
 
     conversation_history = cursor.fetchall()
@@ -14,25 +26,71 @@ def get_conversation_history(session_id, user_id):
     return [
         {
             'role': message['role'],
-            'content': message['content']
+            'content': message['content'],
+            'token_count': message['token_count'],
+            'sequence_id': message['sequence_id']
         } for message in conversation_history
     ]
 
-def save_message_to_db(session_id, user_id, message_id, role, content, parent_message_id, token_count):
-    db = get_db()
+def allocate_sequence_ids(db, session_id, count):
+    """Reserve count consecutive sequence ids for a session and return the first.
 
+    The UPDATE takes the write lock before the counter is read, so concurrent
+    writers serialize on it instead of racing on MAX(sequence_id). Must run
+    inside the caller's transaction.
+    """
     cursor = db.execute(
-        'SELECT sequence_id FROM messages WHERE session_id = ? ORDER BY sequence_id DESC LIMIT 1',
-        (session_id,)
-    ).fetchone()
+        'UPDATE sessions SET last_sequence_id = last_sequence_id + ? WHERE id = ?',
+        (count, session_id)
+    )
 
-    if cursor:
-        sequence_id = cursor['sequence_id'] + 1
+    if cursor.rowcount:
+        last_sequence_id = db.execute(
+            'SELECT last_sequence_id FROM sessions WHERE id = ?',
+            (session_id,)
+        ).fetchone()['last_sequence_id']
     else:
-        sequence_id = 1
+        # The session row is gone (deleted mid-stream), fall back to the messages table
+        cursor = db.execute(
+            'SELECT MAX(sequence_id) AS sequence_id FROM messages WHERE session_id = ?',
+            (session_id,)
+        ).fetchone()
+        last_sequence_id = (cursor['sequence_id'] or 0) + count
 
-    db.execute(
-        'INSERT INTO messages (id, session_id, user_id, role, content, token_count, parent_id, sequence_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-        (message_id, session_id, user_id, role, content, token_count, parent_message_id, sequence_id)
-    )
-    db.commit()
\ No newline at end of file
+    return last_sequence_id - count + 1
+
+def save_messages_to_db(session_id, user_id, messages):
+    """Persist several messages of one turn in a single transaction.
+
+    messages is a list of (message_id, role, content, parent_message_id, token_count)
+    tuples; they get consecutive sequence ids in list order.
+    """
+    db = get_db()
+
+    try:
+        sequence_id = allocate_sequence_ids(db, session_id, len(messages))
+
+        db.executemany(
+            'INSERT INTO messages (id, session_id, user_id, role, content, token_count, parent_id, sequence_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            [
+                (message_id, session_id, user_id, role, content, token_count, parent_message_id, sequence_id + offset)
+                for offset, (message_id, role, content, parent_message_id, token_count) in enumerate(messages)
+            ]
+        )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    # Bump before appending: a populate_history that read SQLite before the
+    # commit is watching the version, so its stale window is refused whether
+    # it would land before or after append_history finds no window to extend
+    redis = get_redis()
+    bump_session_version(redis, session_id)
+    append_history(redis, session_id, user_id, [
+        {'role': role, 'content': content, 'token_count': token_count, 'sequence_id': sequence_id + offset}
+        for offset, (_, role, content, _, token_count) in enumerate(messages)
+    ])
+
+def save_message_to_db(session_id, user_id, message_id, role, content, parent_message_id, token_count):
+    save_messages_to_db(session_id, user_id, [(message_id, role, content, parent_message_id, token_count)])
@@ -0,0 +1,60 @@
+import hashlib
+import os
+import time
+
+from flask import Response, request
+
+from cache import TTLCache
+
+SESSION_VERSION_TTL = int(os.getenv('SESSION_VERSION_TTL', 7 * 24 * 3600))
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', 1024))
+RENDER_CACHE_TTL = int(os.getenv('RENDER_CACHE_TTL', 300))
+
+# Keyed by (session_id, user_id, version), so a bump makes old entries
+# unreachable and they age out on their own
+render_cache = TTLCache(RENDER_CACHE_SIZE, RENDER_CACHE_TTL)
+
+def version_key(session_id):
+    return f"session:{session_id}:version"
+
+def new_epoch():
+    # A counter that went missing (eviction, flush, TTL) restarts from the
+    # clock, above anything it handed out before, so old ETags never match
+    return int(time.time() * 1000)
+
+def get_session_version(redis, session_id):
+    key = version_key(session_id)
+    version = redis.get(key)
+
+    if version is None:
+        redis.set(key, new_epoch(), ex=SESSION_VERSION_TTL, nx=True)
+        version = redis.get(key)
+
+    return version
+
+def bump_session_version(redis, session_id):
+    """Invalidate ETags and cached payloads for a session.
+
+    Call after the change is committed, so a reader that sees the new version
+    also sees the new data.
+    """
+    key = version_key(session_id)
+
+    if not redis.set(key, new_epoch(), ex=SESSION_VERSION_TTL, nx=True):
+        redis.incr(key)
+
+def make_etag(*parts):
+    return hashlib.sha1(':'.join(str(part) for part in parts).encode()).hexdigest()
+
+def is_not_modified(etag):
+    # If-None-Match always uses the weak comparison
+    return request.if_none_match.contains_weak(etag)
+
+def not_modified(etag, weak=False):
+    response = Response(status=304)
+    response.set_etag(etag, weak=weak)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def get_render_cache_stats():
+    return render_cache.get_stats()
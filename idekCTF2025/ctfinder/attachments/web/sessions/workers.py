@@ -0,0 +1,150 @@
+from concurrent.futures import ThreadPoolExecutor
+import os
+import threading
+import time
+import traceback
+
+STREAM_WORKERS = int(os.getenv('STREAM_WORKERS', 32))
+STREAM_QUEUE_SIZE = int(os.getenv('STREAM_QUEUE_SIZE', 64))
+STREAM_MAX_PER_USER = int(os.getenv('STREAM_MAX_PER_USER', 2))
+STREAM_RETRY_AFTER = int(os.getenv('STREAM_RETRY_AFTER', 5))
+STREAM_DRAIN_TIMEOUT = float(os.getenv('STREAM_DRAIN_TIMEOUT', 10))
+
+
+class StreamQueueFull(Exception):
+    pass
+
+
+class UserLimitReached(Exception):
+    pass
+
+
+class StreamExecutor:
+    """Runs stream_claude_response on a fixed set of threads.
+
+    At most max_workers jobs run at once and at most max_queue wait behind
+    them; anything beyond that is rejected up front so the caller can shed
+    load instead of piling up threads and upstream connections.
+    """
+
+    def __init__(self, max_workers=STREAM_WORKERS, max_queue=STREAM_QUEUE_SIZE, max_per_user=STREAM_MAX_PER_USER):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='stream')
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._per_user = {}
+        self.closing = False
+        self.stats = {
+            'queued': 0,
+            'active': 0,
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'rejected_full': 0,
+            'rejected_user': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0,
+        }
+
+    def submit(self, user_id, fn, *args):
+        with self._lock:
+            if self.closing or self.stats['queued'] + self.stats['active'] >= self.max_workers + self.max_queue:
+                self.stats['rejected_full'] += 1
+                raise StreamQueueFull()
+
+            if self.max_per_user and self._per_user.get(user_id, 0) >= self.max_per_user:
+                self.stats['rejected_user'] += 1
+                raise UserLimitReached()
+
+            self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+            self.stats['queued'] += 1
+            self.stats['submitted'] += 1
+
+        enqueued_at = time.monotonic()
+
+        def run():
+            waited = time.monotonic() - enqueued_at
+            with self._lock:
+                self.stats['queued'] -= 1
+                self.stats['active'] += 1
+                self.stats['wait_total'] += waited
+                self.stats['wait_max'] = max(self.stats['wait_max'], waited)
+
+            failed = False
+            try:
+                fn(*args)
+            except Exception:
+                failed = True
+                traceback.print_exc()
+            finally:
+                with self._lock:
+                    self.stats['active'] -= 1
+                    self.stats['completed'] += 1
+                    if failed:
+                        self.stats['failed'] += 1
+                    if self._per_user[user_id] <= 1:
+                        del self._per_user[user_id]
+                    else:
+                        self._per_user[user_id] -= 1
+                    if not self.stats['queued'] and not self.stats['active']:
+                        self._idle.notify_all()
+
+        try:
+            return self._executor.submit(run)
+        except Exception:
+            # e.g. submitted after shutdown; run() will never undo the counts
+            with self._lock:
+                self.stats['queued'] -= 1
+                self.stats['submitted'] -= 1
+                if self._per_user[user_id] <= 1:
+                    del self._per_user[user_id]
+                else:
+                    self._per_user[user_id] -= 1
+                if not self.stats['queued'] and not self.stats['active']:
+                    self._idle.notify_all()
+            raise
+
+    def get_stats(self):
+        with self._lock:
+            stats = dict(self.stats)
+            started = stats['completed'] + stats['active']
+
+        stats['wait_avg'] = stats['wait_total'] / started if started else 0.0
+        stats['max_workers'] = self.max_workers
+        stats['max_queue'] = self.max_queue
+        stats['max_per_user'] = self.max_per_user
+        stats['closing'] = self.closing
+        return stats
+
+    def close(self):
+        """Refuse new jobs from now on; submit raises StreamQueueFull"""
+        with self._idle:
+            self.closing = True
+
+    def drain(self, timeout=STREAM_DRAIN_TIMEOUT):
+        """Refuse new jobs and wait up to timeout seconds for the queued and
+        running ones, so their replies are saved before the process exits.
+
+        Returns the number of jobs still unfinished.
+        """
+        deadline = time.monotonic() + timeout
+        with self._idle:
+            self.closing = True
+            while self.stats['queued'] or self.stats['active']:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._idle.wait(remaining)
+
+            return self.stats['queued'] + self.stats['active']
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+
+stream_executor = StreamExecutor()
+
+def get_stream_executor():
+    return stream_executor
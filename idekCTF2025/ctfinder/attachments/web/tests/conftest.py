@@ -0,0 +1,30 @@
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# database.py reads these at import time
+os.environ.setdefault('DATABASE_PATH', os.path.join(tempfile.mkdtemp(), 'ctfinder.db'))
+os.environ.setdefault('ADMIN_USERNAME', 'admin')
+os.environ.setdefault('ADMIN_PASSWORD', 'admin')
+
+import fakeredis
+import pytest
+
+import redis_config
+
+@pytest.fixture
+def redis(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(redis_config, 'redis_client', client)
+    monkeypatch.setattr(redis_config, 'pubsub_redis_client', client)
+    return client
+
+@pytest.fixture(scope='session')
+def app():
+    from app import app as flask_app
+    from database import init_db
+
+    init_db(flask_app)
+    return flask_app
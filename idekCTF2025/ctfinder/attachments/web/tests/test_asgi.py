@@ -0,0 +1,34 @@
+import asyncio
+
+import fakeredis
+import pytest
+
+import asgi
+
+@pytest.fixture
+def multiplexer(monkeypatch):
+    client = fakeredis.FakeAsyncRedis(decode_responses=True)
+    monkeypatch.setattr(asgi, 'get_async_pubsub_redis', lambda: client)
+    return asgi.AsyncPubSubMultiplexer(), client
+
+def test_reader_stops_without_subscribers(multiplexer):
+    multiplexer, client = multiplexer
+
+    async def scenario():
+        subscriber = await multiplexer.subscribe('c1')
+        await client.publish('c1', 'hello')
+        assert await asyncio.wait_for(subscriber.get(), 2) == 'hello'
+
+        await multiplexer.unsubscribe('c1', subscriber)
+        # a reconnect with nothing to resubscribe leaves a pubsub whose
+        # get_message raises
+        await multiplexer._reconnect()
+        await asyncio.wait_for(multiplexer._task, 3)
+
+        subscriber = await multiplexer.subscribe('c2')
+        await client.publish('c2', 'again')
+        assert await asyncio.wait_for(subscriber.get(), 2) == 'again'
+        await multiplexer.unsubscribe('c2', subscriber)
+        await asyncio.wait_for(multiplexer._task, 3)
+
+    asyncio.run(scenario())
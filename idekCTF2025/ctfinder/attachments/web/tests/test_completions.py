@@ -0,0 +1,14 @@
+import sessions.completions as completions
+
+BODY = {'model': 'm', 'max_tokens': 10, 'messages': [{'role': 'user', 'content': 'hi'}], 'stream': True}
+
+def test_hits_are_scoped_to_the_api_key(monkeypatch):
+    monkeypatch.setattr(completions, 'COMPLETION_CACHE', True)
+    completions.completion_cache.clear()
+
+    completions.store_completion(BODY, 'key-a', 'hello', 3)
+
+    assert completions.get_cached_completion(BODY, 'key-a') == ('hello', 3)
+    assert completions.get_cached_completion(dict(BODY, stream=False), 'key-a') == ('hello', 3)
+    assert completions.get_cached_completion(BODY, 'key-b') is None
+    assert completions.get_cached_completion(BODY, None) is None
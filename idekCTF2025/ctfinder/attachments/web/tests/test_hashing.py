@@ -0,0 +1,48 @@
+import uuid
+
+import pytest
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS
+
+import auth.hashing as hashing
+
+PBKDF2 = f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}$salt$hash'
+
+def test_needs_rehash_fills_in_method_defaults(monkeypatch):
+    for method in ('pbkdf2:sha256', f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}'):
+        monkeypatch.setattr(hashing, 'PASSWORD_HASH_METHOD', method)
+        assert not hashing.needs_rehash(PBKDF2)
+
+    assert hashing.needs_rehash('pbkdf2:sha256:1000$salt$hash')
+
+def test_check_method_rejects_unsupported_methods():
+    hashing.check_method('pbkdf2:sha512:1000')
+
+    for method in ('scrypt', 'pbkdf2:sha512:300000x', 'nope'):
+        with pytest.raises(ValueError):
+            hashing.check_method(method)
+
+def test_login_survives_a_failed_rehash(app, monkeypatch):
+    from werkzeug.security import generate_password_hash
+    from database import get_db
+
+    hasher = hashing.get_password_hasher()
+    monkeypatch.setattr(hasher, 'max_workers', 0)
+
+    def broken_hash(password):
+        raise ValueError('unsupported method')
+    monkeypatch.setattr(hasher, 'hash', broken_hash)
+
+    user_id = str(uuid.uuid4())
+    old_hash = generate_password_hash('secret', 'pbkdf2:sha256:1000')
+    with app.app_context():
+        db = get_db()
+        db.execute('INSERT INTO users (id, username, password, is_admin) VALUES (?, ?, ?, ?)',
+                   (user_id, f'user-{user_id}', old_hash, False))
+        db.commit()
+
+    response = app.test_client().post('/auth/login', json={'username': f'user-{user_id}', 'password': 'secret'})
+    assert response.status_code == 200
+
+    with app.app_context():
+        stored = get_db().execute('SELECT password FROM users WHERE id = ?', (user_id,)).fetchone()
+    assert stored['password'] == old_hash
@@ -0,0 +1,54 @@
+import threading
+import time
+
+from sessions import hedging
+
+class FakeSocket:
+    def shutdown(self, how):
+        pass
+
+class FakeConnection:
+    sock = FakeSocket()
+
+class FakeRaw:
+    _connection = FakeConnection()
+
+class FakeResponse:
+    raw = FakeRaw()
+
+    def __init__(self, status_code):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def test_losing_error_response_is_closed():
+    responses = []
+    lock = threading.Lock()
+
+    def start():
+        with lock:
+            index = len(responses)
+            response = FakeResponse(503 if index == 0 else 200)
+            responses.append(response)
+
+        if index == 0:
+            # fails after the hedge has started, before it has a delta
+            time.sleep(0.02)
+            return response, iter(())
+
+        def reply():
+            time.sleep(0.05)
+            yield 'delta', 'hi'
+            yield 'tokens', 1
+            response.close()
+
+        return response, reply()
+
+    response, reply = hedging.hedged_reply(start, hedge_after_ms=5)
+
+    assert response is responses[1]
+    assert list(reply) == [('delta', 'hi'), ('tokens', 1)]
+    assert [response.closed for response in responses] == [True, True]
@@ -0,0 +1,75 @@
+import threading
+import uuid
+
+import sessions.utils
+from database import get_db
+from sessions.history import read_history, populate_history
+from sessions.utils import load_conversation_history, save_messages_to_db
+
+def create_session(app, user_id):
+    session_id = str(uuid.uuid4())
+    with app.app_context():
+        db = get_db()
+        db.execute('INSERT INTO sessions (id, user_id) VALUES (?, ?)', (session_id, user_id))
+        db.commit()
+    return session_id
+
+def turn(content):
+    return [
+        (str(uuid.uuid4()), 'user', content, None, 0),
+        (str(uuid.uuid4()), 'assistant', f're: {content}', None, 5),
+    ]
+
+def test_save_appends_to_an_existing_window(app, redis):
+    session_id = create_session(app, 'u1')
+
+    with app.app_context():
+        save_messages_to_db(session_id, 'u1', turn('one'))
+        populate_history(redis, session_id, 'u1', lambda: load_conversation_history(session_id, 'u1'))
+        save_messages_to_db(session_id, 'u1', turn('two'))
+
+    window = read_history(redis, session_id, 'u1')
+    assert [entry['content'] for entry in window] == ['one', 're: one', 'two', 're: two']
+    assert [entry['sequence_id'] for entry in window] == [1, 2, 3, 4]
+
+def test_populate_racing_a_save_never_caches_a_stale_window(app, redis, monkeypatch):
+    """populate reads SQLite, then a save commits and finds no window to
+    append to, then populate writes back what it read before the commit."""
+    session_id = create_session(app, 'u1')
+    with app.app_context():
+        save_messages_to_db(session_id, 'u1', turn('one'))
+
+    loaded = threading.Event()
+    write_back = threading.Event()
+    populated = threading.Event()
+
+    def populate():
+        def load():
+            with app.app_context():
+                entries = load_conversation_history(session_id, 'u1')
+            loaded.set()
+            write_back.wait(5)
+            return entries
+
+        populate_history(redis, session_id, 'u1', load)
+        populated.set()
+
+    append_history = sessions.utils.append_history
+
+    def append_then_let_populate_finish(*args):
+        append_history(*args)
+        write_back.set()
+        populated.wait(5)
+
+    monkeypatch.setattr(sessions.utils, 'append_history', append_then_let_populate_finish)
+
+    thread = threading.Thread(target=populate)
+    thread.start()
+    loaded.wait(5)
+
+    with app.app_context():
+        save_messages_to_db(session_id, 'u1', turn('two'))
+    thread.join(5)
+
+    window = read_history(redis, session_id, 'u1')
+    assert window is None or [entry['content'] for entry in window][-2:] == ['two', 're: two']
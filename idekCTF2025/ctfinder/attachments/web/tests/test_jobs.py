@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from sessions import jobs
+from sessions.workers import UserLimitReached
+
+CHANNEL = 'session:s1:u1:1:stream'
+
+def enqueue(redis, user_id='u1'):
+    return jobs.enqueue_turn('s1', user_id, 'hi', 'm1', CHANNEL, redis)
+
+def in_flight(redis, user_id='u1'):
+    return int(redis.get(jobs.user_key(user_id)) or 0)
+
+def test_reserve_and_ack(redis):
+    job_id = enqueue(redis)
+
+    job = jobs.reserve(redis, timeout=0.1)
+    assert job.id == job_id
+    assert job.payload['stream_channel'] == CHANNEL
+    assert job.attempts == 0
+    assert redis.lrange(jobs.PROCESSING_KEY, 0, -1) == [job_id]
+    assert redis.zscore(jobs.DEADLINES_KEY, job_id) is not None
+
+    jobs.ack(redis, job_id)
+
+    assert redis.llen(jobs.PROCESSING_KEY) == 0
+    assert redis.zcard(jobs.DEADLINES_KEY) == 0
+    assert jobs.get_payload(redis, job_id) is None
+    assert in_flight(redis) == 0
+    assert jobs.reserve(redis, timeout=0.1) is None
+
+def test_per_user_limit(redis, monkeypatch):
+    monkeypatch.setattr(jobs, 'STREAM_MAX_PER_USER', 2)
+
+    enqueue(redis)
+    enqueue(redis)
+    with pytest.raises(UserLimitReached):
+        enqueue(redis)
+    assert in_flight(redis) == 2
+
+    enqueue(redis, 'u2')
+
+    jobs.ack(redis, jobs.reserve(redis, timeout=0.1).id)
+    enqueue(redis)
+    assert in_flight(redis) == 2
+
+def test_fail_retries_then_dead_letters(redis, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_MAX_ATTEMPTS', 2)
+    job_id = enqueue(redis)
+
+    jobs.reserve(redis, timeout=0.1)
+    assert jobs.fail(redis, job_id) is False
+    assert redis.lrange(jobs.PENDING_KEY, 0, -1) == [job_id]
+    assert in_flight(redis) == 1
+
+    job = jobs.reserve(redis, timeout=0.1)
+    assert job.attempts == 1
+    assert jobs.fail(redis, job_id) is True
+
+    assert redis.lrange(jobs.DEAD_KEY, 0, -1) == [job_id]
+    assert redis.llen(jobs.PENDING_KEY) == 0
+    assert redis.llen(jobs.PROCESSING_KEY) == 0
+    assert in_flight(redis) == 0
+
+def test_requeue_expired(redis, monkeypatch):
+    monkeypatch.setattr(jobs, 'JOB_MAX_ATTEMPTS', 2)
+    job_id = enqueue(redis)
+
+    jobs.reserve(redis, timeout=0.1)
+    assert jobs.requeue_expired(redis) == ([], [])
+
+    redis.zadd(jobs.DEADLINES_KEY, {job_id: 0})
+    assert jobs.requeue_expired(redis) == ([job_id], [])
+    assert redis.lrange(jobs.PENDING_KEY, 0, -1) == [job_id]
+
+    jobs.reserve(redis, timeout=0.1)
+    redis.zadd(jobs.DEADLINES_KEY, {job_id: 0})
+    assert jobs.requeue_expired(redis) == ([], [job_id])
+    assert redis.lrange(jobs.DEAD_KEY, 0, -1) == [job_id]
+    assert in_flight(redis) == 0
+
+def test_requeue_expired_gives_orphans_a_deadline(redis):
+    job_id = enqueue(redis)
+    redis.lmove(jobs.PENDING_KEY, jobs.PROCESSING_KEY, 'RIGHT', 'LEFT')
+
+    assert jobs.requeue_expired(redis) == ([], [])
+    assert redis.zscore(jobs.DEADLINES_KEY, job_id) is not None
+
+def test_worker_acks_a_turn_whose_meta_is_gone(redis, app, monkeypatch):
+    from sessions import transport
+    from worker import StreamWorker
+
+    monkeypatch.setattr(transport, 'STREAM_TRANSPORT', 'streams')
+
+    ran = []
+    worker = StreamWorker(redis, run_turn=lambda *args: ran.append(args))
+    enqueue(redis)
+
+    worker.run_job(jobs.reserve(redis, timeout=0.1))
+
+    assert ran == []
+    assert worker.stats['expired'] == 1
+    assert redis.llen(jobs.PROCESSING_KEY) == 0
+    assert redis.llen(jobs.PENDING_KEY) == 0
+    assert in_flight(redis) == 0
+
+    [(_, fields)] = redis.xrange(CHANNEL)
+    assert json.loads(fields['data'])['event'] == 'error'
@@ -0,0 +1,36 @@
+import json
+import time
+
+from sessions import transport
+from sessions.publisher import CoalescingPublisher
+
+CHANNEL = 'session:s1:u1:1:stream'
+
+def chunks(redis):
+    return [json.loads(fields['data'])['content'] for _, fields in redis.xrange(CHANNEL)]
+
+def test_window_flushes_without_another_delta(redis, monkeypatch):
+    monkeypatch.setattr(transport, 'STREAM_TRANSPORT', 'streams')
+    publisher = CoalescingPublisher(redis, CHANNEL, 'm1', window_ms=20)
+
+    publisher.add('hel')
+    publisher.add('lo')
+    assert chunks(redis) == []
+
+    time.sleep(0.2)
+    assert chunks(redis) == ['hello']
+
+    publisher.flush()
+    assert chunks(redis) == ['hello']
+
+def test_max_bytes_flushes_immediately(redis, monkeypatch):
+    monkeypatch.setattr(transport, 'STREAM_TRANSPORT', 'streams')
+    publisher = CoalescingPublisher(redis, CHANNEL, 'm1', window_ms=10000, max_bytes=4)
+
+    publisher.add('ab')
+    publisher.add('cd')
+    publisher.add('e')
+    assert chunks(redis) == ['abcd']
+
+    publisher.flush()
+    assert chunks(redis) == ['abcd', 'e']
@@ -0,0 +1,20 @@
+import ratelimit
+
+def user_tokens(redis, user_id):
+    return float(redis.hget(f'ratelimit:user:{user_id}', 'tokens'))
+
+def test_refund_gives_back_what_admit_took(redis, monkeypatch):
+    monkeypatch.setattr(ratelimit, 'RATE_LIMIT_USER_RATE', 0.001)
+    monkeypatch.setattr(ratelimit, 'RATE_LIMIT_USER_BURST', 2)
+
+    assert ratelimit.admit('u1') == (True, 0)
+    assert ratelimit.admit('u1') == (True, 0)
+    assert ratelimit.admit('u1')[0] is False
+
+    ratelimit.refund('u1')
+    assert ratelimit.admit('u1') == (True, 0)
+
+    ratelimit.refund('u1')
+    ratelimit.refund('u1')
+    ratelimit.refund('u1')
+    assert user_tokens(redis, 'u1') <= 2
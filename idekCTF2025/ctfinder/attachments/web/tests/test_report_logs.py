@@ -0,0 +1,31 @@
+import base64
+import json
+
+import pytest
+
+from admins.utils import parse_timestamp, report_content_hash, encode_cursor, decode_cursor, InvalidReportQuery
+from migrations import report_content_hash_v3
+
+def test_parse_timestamp_converts_offsets_to_utc():
+    assert parse_timestamp('2025-01-01', 'since') == '2025-01-01 00:00:00'
+    assert parse_timestamp('2025-01-01T10:00:00', 'since') == '2025-01-01 10:00:00'
+    assert parse_timestamp('2025-01-01T10:00:00+02:00', 'since') == '2025-01-01 08:00:00'
+    assert parse_timestamp('2025-01-01T01:00:00+02:00', 'since') == '2024-12-31 23:00:00'
+
+def test_migration_hash_is_frozen():
+    frozen = 'e2747ffcb6a245814535a29c2de5c3bff2831dfc82ddb8af8edd259d9cdf9f32'
+    assert report_content_hash_v3('u1', 'spam') == frozen
+    # rows inserted by admins.routes must match what the backfill wrote
+    assert report_content_hash('u1', 'spam') == frozen
+
+def test_decode_cursor_rejects_forged_cursors():
+    created_at, report_id = decode_cursor(encode_cursor('2025-01-01 10:00:00', 'r1'))
+    assert (created_at, report_id) == ('2025-01-01 10:00:00', 'r1')
+
+    for forged in ([[1], {'a': 1}], ['2025-01-01 10:00:00', 1], ['not a date', 'r1'], ['a', 'b', 'c'], 'ab', 5):
+        cursor = base64.urlsafe_b64encode(json.dumps(forged).encode()).decode()
+        with pytest.raises(InvalidReportQuery):
+            decode_cursor(cursor)
+
+    with pytest.raises(InvalidReportQuery):
+        decode_cursor('%%%')
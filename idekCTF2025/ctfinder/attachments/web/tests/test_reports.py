@@ -0,0 +1,44 @@
+import pytest
+import redis as redis_py
+
+from sessions import reports
+from sessions.workers import StreamExecutor, StreamQueueFull
+
+class BotReply:
+    def json(self):
+        return {'message': 'Bot visited the URL'}
+
+def start_job(redis, job_id='j1'):
+    redis.set(reports.pending_key('s1', 'u1'), job_id)
+    reports.set_status(redis, job_id, 'queued')
+
+def test_visit_marks_redis_errors_failed(redis, monkeypatch):
+    def bump(redis, session_id):
+        raise redis_py.ConnectionError('gone')
+
+    monkeypatch.setattr(reports.bot_session, 'get', lambda *args, **kwargs: BotReply())
+    monkeypatch.setattr(reports, 'bump_session_version', bump)
+    start_job(redis)
+
+    reports.visit('j1', 's1', 'u1')
+
+    assert reports.get_report_job('j1')['status'] == 'failed'
+    assert redis.get(reports.pending_key('s1', 'u1')) is None
+
+def test_visit_sent(redis, monkeypatch):
+    monkeypatch.setattr(reports.bot_session, 'get', lambda *args, **kwargs: BotReply())
+    start_job(redis)
+
+    reports.visit('j1', 's1', 'u1')
+
+    assert reports.get_report_job('j1')['status'] == 'sent'
+    assert redis.get(reports.pending_key('s1', 'u1')) is None
+
+def test_closed_executor_refuses_jobs():
+    executor = StreamExecutor(max_workers=1, max_queue=1)
+    executor.close()
+
+    with pytest.raises(StreamQueueFull):
+        executor.submit('u1', print)
+    assert executor.drain(timeout=0) == 0
+    executor.shutdown()
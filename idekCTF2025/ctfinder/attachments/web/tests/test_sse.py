@@ -0,0 +1,34 @@
+from sessions.sse import SSEParser
+
+STREAM = (
+    b'event: message_start\r\ndata: {"type": "message_start"}\r\n\r\n'
+    b'event: content_block_delta\r\ndata: {"delta": {"text": "hi"}}\r\n\r\n'
+    b'event: message_stop\r\ndata: {"type": "message_stop"}\r\n\r\n'
+)
+
+def feed_all(chunks):
+    parser = SSEParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    return events
+
+def test_whole_stream():
+    assert feed_all([STREAM]) == [
+        ('message_start', b'{"type": "message_start"}'),
+        ('content_block_delta', b'{"delta": {"text": "hi"}}'),
+        ('message_stop', b'{"type": "message_stop"}'),
+    ]
+
+def test_crlf_split_across_chunks():
+    expected = feed_all([STREAM])
+
+    for i, byte in enumerate(STREAM):
+        if byte == ord('\r'):
+            assert feed_all([STREAM[:i + 1], STREAM[i + 1:]]) == expected
+
+def test_one_byte_at_a_time():
+    assert feed_all([STREAM[i:i + 1] for i in range(len(STREAM))]) == feed_all([STREAM])
+
+def test_lf_only_stream():
+    assert feed_all([STREAM.replace(b'\r\n', b'\n')]) == feed_all([STREAM])
@@ -0,0 +1,39 @@
+import uuid
+
+from database import get_db
+from tokens import utils
+
+def set_token(user_id, token):
+    db = get_db()
+    db.execute('DELETE FROM tokens WHERE user_id = ?', (user_id,))
+    db.execute('INSERT INTO tokens (id, token, user_id) VALUES (?, ?, ?)', (str(uuid.uuid4()), token, user_id))
+    db.commit()
+
+def bump_from_another_process(redis, user_id):
+    # what invalidate_token in another process leaves behind: a new version,
+    # and this process's cache untouched
+    local = utils.token_cache
+    utils.token_cache = utils.TTLCache(1, 1)
+    try:
+        utils.invalidate_token(user_id)
+    finally:
+        utils.token_cache = local
+
+def test_invalidation_reaches_other_processes(redis, app):
+    user_id = str(uuid.uuid4())
+
+    with app.app_context():
+        assert utils.get_token_by_user_id(user_id) is None
+
+        set_token(user_id, f'key-{user_id}-1')
+        assert utils.get_token_by_user_id(user_id) is None
+        bump_from_another_process(redis, user_id)
+        assert utils.get_token_by_user_id(user_id) == f'key-{user_id}-1'
+
+        set_token(user_id, f'key-{user_id}-2')
+        bump_from_another_process(redis, user_id)
+        assert utils.get_token_by_user_id(user_id) == f'key-{user_id}-2'
+
+        hits = utils.token_cache.stats['hits']
+        assert utils.get_token_by_user_id(user_id) == f'key-{user_id}-2'
+        assert utils.token_cache.stats['hits'] == hits + 1
@@ -0,0 +1,36 @@
+import pytest
+
+from sessions.transport import read_events, StreamGone
+
+def test_empty_read_yields_heartbeat_tick(redis):
+    events = read_events(redis, 'session:s:u:m:stream', block_ms=1, idle_timeout=60)
+
+    assert next(events) == (None, None)
+
+def test_entries_are_yielded_in_order(redis):
+    channel = 'session:s:u:m:stream'
+    first = redis.xadd(channel, {'data': 'a'})
+    second = redis.xadd(channel, {'data': 'b'})
+
+    events = read_events(redis, channel, block_ms=1, idle_timeout=60)
+
+    assert next(events) == (first, 'a')
+    assert next(events) == (second, 'b')
+
+def test_expired_channel_ends_the_stream(redis):
+    channel = 'session:s:u:m:stream'
+    entry_id = redis.xadd(channel, {'data': 'a'})
+    events = read_events(redis, channel, block_ms=1, idle_timeout=60)
+
+    assert next(events) == (entry_id, 'a')
+    assert next(events) == (None, None)
+
+    redis.delete(channel)
+    with pytest.raises(StreamGone):
+        next(events)
+
+def test_channel_that_never_appears_times_out(redis):
+    events = read_events(redis, 'session:s:u:m:stream', block_ms=1, idle_timeout=0)
+
+    with pytest.raises(StreamGone):
+        next(events)
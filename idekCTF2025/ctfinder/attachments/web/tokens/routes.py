@@ -4,6 +4,7 @@ import sqlite3
 import uuid
 from decorators import login_required
 from database import get_db
+from tokens.utils import invalidate_token
 
 token_bp = Blueprint('tokens', __name__, url_prefix='/tokens')
 
@@ -56,5 +57,6 @@ def token():
         )
 
     db.commit()
+    invalidate_token(user_id)
 
     return jsonify({'message': 'token applied'}), 201
\ No newline at end of file
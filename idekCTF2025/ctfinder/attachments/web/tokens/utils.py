@@ -1,6 +1,35 @@
+import os
+
+from cache import TTLCache
 from database import get_db
+from redis_config import get_redis
+from sessions.versions import new_epoch
+
+TOKEN_CACHE_SIZE = int(os.getenv('TOKEN_CACHE_SIZE', 4096))
+TOKEN_CACHE_TTL = int(os.getenv('TOKEN_CACHE_TTL', 10))
+TOKEN_VERSION_TTL = int(os.getenv('TOKEN_VERSION_TTL', 7 * 24 * 3600))
+
+# users without a token are cached too, so token_required stays off SQLite
+# for them; POST /tokens invalidates either way
+NO_TOKEN = object()
+
+# Entries are (version, token). Every web process and the stream worker keep
+# their own cache, so POST /tokens bumps the user's version in Redis and an
+# entry read under an older version is looked up again.
+token_cache = TTLCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL)
+
+def token_version_key(user_id):
+    return f"token:{user_id}:version"
 
 def get_token_by_user_id(user_id):
+    # read before the query, so a bump that lands while it runs leaves this
+    # entry behind the new version
+    version = get_redis().get(token_version_key(user_id))
+
+    cached = token_cache.get(user_id)
+    if cached is not None and cached[0] == version:
+        return None if cached[1] is NO_TOKEN else cached[1]
+
     db = get_db()
     
     cursor = db.execute(
@@ -8,4 +37,19 @@ def get_token_by_user_id(user_id):
         (user_id,)
     ).fetchone()
 
-    return cursor['token'] if cursor else None
\ No newline at end of file
+    token = cursor['token'] if cursor else None
+    token_cache.set(user_id, (version, NO_TOKEN if token is None else token))
+
+    return token
+
+def invalidate_token(user_id):
+    """Call after the token change is committed"""
+    key = token_version_key(user_id)
+    redis = get_redis()
+
+    if not redis.set(key, new_epoch(), ex=TOKEN_VERSION_TTL, nx=True):
+        redis.incr(key)
+    token_cache.delete(user_id)
+
+def get_token_cache_stats():
+    return token_cache.get_stats()
\ No newline at end of file
@@ -0,0 +1,72 @@
+import requests
+import os
+import socket
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+ANTHROPIC_API_URL = os.getenv('ANTHROPIC_API_URL', 'https://api.anthropic.com/v1/messages')
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 32))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 5))
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', 60))
+UPSTREAM_CONNECT_RETRIES = int(os.getenv('UPSTREAM_CONNECT_RETRIES', 3))
+UPSTREAM_RETRY_BACKOFF = float(os.getenv('UPSTREAM_RETRY_BACKOFF', 0.2))
+
+def create_upstream_session():
+    # Only connection failures are retried: the request never reached the
+    # upstream, so replaying the POST cannot start a second generation.
+    retry = Retry(
+        total=None,
+        connect=UPSTREAM_CONNECT_RETRIES,
+        read=0,
+        status=0,
+        other=0,
+        redirect=0,
+        backoff_factor=UPSTREAM_RETRY_BACKOFF,
+        raise_on_status=False
+    )
+
+    adapter = HTTPAdapter(
+        pool_connections=4,
+        pool_maxsize=UPSTREAM_POOL_SIZE,
+        max_retries=retry
+    )
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+upstream_session = create_upstream_session()
+
+def get_upstream_session():
+    return upstream_session
+
+def post_messages(headers, body):
+    return upstream_session.post(
+        ANTHROPIC_API_URL,
+        headers=headers,
+        json=body,
+        stream=True,
+        timeout=(UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT)
+    )
+
+
+def abort_response(response):
+    """Tear down a streaming response from another thread.
+
+    response.close() waits for the lock held by a thread blocked reading the
+    body, so shut the socket down instead: the blocked read returns, the
+    reader's own close() then runs, and the upstream sees the client go away.
+    """
+    connection = getattr(response.raw, '_connection', None)
+    sock = getattr(connection, 'sock', None)
+
+    if sock is None:
+        response.close()
+        return
+
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
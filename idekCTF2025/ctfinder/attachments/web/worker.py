@@ -0,0 +1,184 @@
+"""Stream worker tier: runs the turns that create_message queues when
+STREAM_BACKEND=queue.
+
+    STREAM_BACKEND=queue python worker.py
+
+Each of WORKER_CONCURRENCY threads claims a job from the Redis queue, runs
+stream_claude_response and acks it. A heartbeat keeps the deadlines of
+running jobs ahead of the visibility timeout and a reaper hands jobs of dead
+workers to live ones. On SIGTERM or SIGINT the worker stops claiming jobs,
+waits up to WORKER_DRAIN_TIMEOUT for running ones and puts whatever is left
+back on the queue. Delivery is at-least-once: a worker that dies after
+saving a reply but before acking it will see that turn run again.
+"""
+import json
+import os
+import signal
+import threading
+import time
+import traceback
+
+from app import app
+from redis_config import get_redis
+from sessions import jobs
+from sessions.stream import stream_claude_response
+from sessions.transport import publish_event, close_channel
+
+WORKER_CONCURRENCY = int(os.getenv('WORKER_CONCURRENCY', 8))
+WORKER_DRAIN_TIMEOUT = float(os.getenv('WORKER_DRAIN_TIMEOUT', 30))
+WORKER_REAP_INTERVAL = float(os.getenv('WORKER_REAP_INTERVAL', 5))
+
+
+class StreamWorker:
+    def __init__(self, redis, concurrency=WORKER_CONCURRENCY, run_turn=stream_claude_response):
+        self.redis = redis
+        self.concurrency = concurrency
+        self.run_turn = run_turn
+        self.stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._running = set()
+        self._threads = []
+        self.stats = {
+            'completed': 0,
+            'expired': 0,
+            'failed': 0,
+            'dead': 0,
+            'requeued': 0,
+            'released': 0,
+        }
+
+    def start(self):
+        for i in range(self.concurrency):
+            thread = threading.Thread(target=self._consume, name=f'worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        thread = threading.Thread(target=self._maintain, name='worker-maintain', daemon=True)
+        thread.start()
+
+    def _consume(self):
+        while not self.stopping.is_set():
+            try:
+                job = jobs.reserve(self.redis, timeout=1)
+            except Exception:
+                traceback.print_exc()
+                time.sleep(1)
+                continue
+
+            if job is None:
+                continue
+
+            with self._lock:
+                self._running.add(job.id)
+
+            try:
+                self.run_job(job)
+            finally:
+                with self._lock:
+                    self._running.discard(job.id)
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    def run_job(self, job):
+        payload = job.payload
+
+        if not self.redis.exists(payload['stream_channel'].replace('stream', 'meta')):
+            # the meta expired while the job waited, or a previous attempt
+            # already finished the turn; running it again can only fail
+            self.give_up(payload)
+            jobs.ack(self.redis, job.id)
+            self._count('expired')
+            return
+
+        try:
+            self.run_turn(
+                app, payload['session_id'], payload['user_id'], payload['content'],
+                payload['message_id'], payload['stream_channel']
+            )
+        except Exception:
+            traceback.print_exc()
+            self._count('failed')
+
+            if jobs.fail(self.redis, job.id):
+                self._count('dead')
+                self.give_up(payload)
+            return
+
+        jobs.ack(self.redis, job.id)
+        self._count('completed')
+
+    def give_up(self, payload):
+        # the client is still waiting on the channel; tell it the turn is gone
+        channel = payload['stream_channel']
+        try:
+            publish_event(self.redis, channel, json.dumps({
+                "event": "error",
+                "message": "Error streaming response",
+                "status_code": 500
+            }))
+            self.redis.delete(channel.replace('stream', 'meta'))
+            close_channel(self.redis, channel)
+        except Exception:
+            traceback.print_exc()
+
+    def _maintain(self):
+        heartbeat = jobs.JOB_VISIBILITY_TIMEOUT / 3
+        next_reap = 0
+
+        while not self.stopping.wait(min(heartbeat, WORKER_REAP_INTERVAL)):
+            try:
+                with self._lock:
+                    running = list(self._running)
+                jobs.extend(self.redis, running)
+
+                if time.monotonic() >= next_reap:
+                    requeued, dead = jobs.requeue_expired(self.redis)
+                    self._count('requeued', len(requeued))
+                    self._count('dead', len(dead))
+
+                    for job_id in dead:
+                        payload = jobs.get_payload(self.redis, job_id)
+                        if payload:
+                            self.give_up(payload)
+                    next_reap = time.monotonic() + WORKER_REAP_INTERVAL
+            except Exception:
+                traceback.print_exc()
+
+    def drain(self, timeout=WORKER_DRAIN_TIMEOUT):
+        """Stop claiming jobs, wait for running ones, release the rest."""
+        self.stopping.set()
+
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+
+        with self._lock:
+            unfinished = list(self._running)
+
+        for job_id in unfinished:
+            jobs.release(self.redis, job_id)
+            self._count('released')
+
+        return unfinished
+
+def main():
+    worker = StreamWorker(get_redis())
+
+    def stop(signum, frame):
+        print(f'worker: signal {signum}, draining')
+        worker.stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    worker.start()
+    print(f'worker: {worker.concurrency} threads on {jobs.PENDING_KEY}')
+
+    worker.stopping.wait()
+    unfinished = worker.drain()
+    print(f'worker: stopped, {len(unfinished)} jobs released, {worker.stats}')
+
+if __name__ == '__main__':
+    main()